@@ -8,23 +8,66 @@ import numpy as np
 # 5. collision
 
 class Force:
+    # Name of a compiled kernel in Kernels.py for this force, used instead of apply() when registered
+    kernel = None
+    
     def apply(self, particles):
         pass
+    
+    def kernel_args(self):
+        """ Force parameters passed to the kernel after (position, velocity, mass, force). """
+        return ()
+
+    def jacobian(self, particles):
+        """
+        Force derivatives for implicit integration as 2x2 blocks.
+        Returns (i, j, df_dx, df_dv): block b is d(force of particle i[b]) / d(state of particle j[b]),
+        with df_dx and df_dv of shape (B, 2, 2). None if the force does not depend on the state.
+        """
+        return None
+
+
+def spring_jacobian(i, j, l, k_s, k_d, l0):
+    """ Blocks of damped springs between particles i and j with current elongation l = x_i - x_j. """
+    length = np.sqrt(np.einsum('ij,ij->i', l, l))
+    valid = length >= 1e-6
+    safe_length = np.where(valid, length, 1.0)
+    n = l / safe_length[:, None]
+    
+    P = n[:, :, None] * n[:, None, :]
+    I = np.broadcast_to(np.eye(2), P.shape)
+    
+    # The transverse term is clamped at zero for compressed springs so that -df_dx stays positive semi-definite
+    transverse = np.maximum(0.0, 1.0 - l0 / safe_length)
+    K = -k_s[:, None, None] * (P + transverse[:, None, None] * (I - P))
+    D = -k_d[:, None, None] * P
+    K[~valid] = 0.0
+    D[~valid] = 0.0
+    
+    rows = np.concatenate([i, j, i, j])
+    cols = np.concatenate([i, j, j, i])
+    return rows, cols, np.concatenate([K, K, -K, -K]), np.concatenate([D, D, -D, -D])
 
 class Gravity(Force):
+    kernel = 'gravity'
+    
     def __init__(self, gravity=np.array([0, -9.8])):
         self.G = gravity
         
+    def kernel_args(self):
+        return (np.asarray(self.G, dtype=np.float64),)
+        
     def apply(self, particles):
-        for p in particles:
-            if np.isinf(p.mass):
-                continue
-            # -----------------------------
-            # TODO (3): Implement Gravity
-            # -----------------------------
-            p.force += p.mass * self.G
+        # -----------------------------
+        # TODO (3): Implement Gravity
+        # - Attached particles (infinite mass) do not feel gravity
+        # -----------------------------
+        free = np.isfinite(particles.mass)
+        particles.force[free] += particles.mass[free, None] * self.G
 
 class Spring(Force):
+    kernel = 'spring'
+    
     def __init__(self, particle1, particle2,  k_s, k_d, l0):
         self.p1 = particle1
         self.p2 = particle2
@@ -32,6 +75,9 @@ class Spring(Force):
         self.k_d = k_d
         self.l0 = l0
         
+    def kernel_args(self):
+        return (self.p1.index, self.p2.index, float(self.k_s), float(self.k_d), float(self.l0))
+        
     def apply(self, particles=None):
         # -----------------------------
         # TODO (4) : Implement Spring Force
@@ -50,7 +96,56 @@ class Spring(Force):
         self.p1.force += f
         self.p2.force += -f
 
+    def jacobian(self, particles=None):
+        l = (self.p1.position - self.p2.position)[None]
+        return spring_jacobian(np.array([self.p1.index]), np.array([self.p2.index]), l,
+                               np.array([self.k_s], dtype=np.float64), np.array([self.k_d], dtype=np.float64),
+                               np.array([self.l0], dtype=np.float64))
+
+class SpringNetwork(Force):
+    """ All springs of a mesh evaluated in one batched pass. """
+    kernel = 'spring_network'
+    
+    def __init__(self, edges, k_s, k_d, l0):
+        self.edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        
+        # Per-edge parameters, scalars are broadcast to every edge
+        num_edges = len(self.edges)
+        self.k_s = np.broadcast_to(np.asarray(k_s, dtype=np.float64), (num_edges,)).copy()
+        self.k_d = np.broadcast_to(np.asarray(k_d, dtype=np.float64), (num_edges,)).copy()
+        self.l0 = np.broadcast_to(np.asarray(l0, dtype=np.float64), (num_edges,)).copy()
+        
+    def kernel_args(self):
+        return (self.edges, self.k_s, self.k_d, self.l0)
+        
+    def apply(self, particles):
+        i, j = self.edges[:, 0], self.edges[:, 1]
+        
+        l = particles.position[i] - particles.position[j]
+        l_dot = particles.velocity[i] - particles.velocity[j]
+        length = np.sqrt(np.einsum('ij,ij->i', l, l))
+        
+        # Degenerate springs exert no force (same as Spring)
+        valid = length >= 1e-6
+        safe_length = np.where(valid, length, 1.0)
+        
+        magnitude = self.k_s * (length - self.l0) + self.k_d * np.einsum('ij,ij->i', l_dot, l) / safe_length
+        f = -(np.where(valid, magnitude, 0.0) / safe_length)[:, None] * l
+        
+        # Scatter-add into the force buffer. bincount sums repeated indices like np.add.at, but much faster.
+        n = len(particles)
+        for axis in range(2):
+            particles.force[:, axis] += np.bincount(i, weights=f[:, axis], minlength=n)
+            particles.force[:, axis] -= np.bincount(j, weights=f[:, axis], minlength=n)
+
+    def jacobian(self, particles):
+        i, j = self.edges[:, 0], self.edges[:, 1]
+        l = particles.position[i] - particles.position[j]
+        return spring_jacobian(i, j, l, self.k_s, self.k_d, self.l0)
+
 class Mouse(Force):
+    kernel = 'mouse'
+    
     def __init__(self, particle, target, k_s=100, k_d=1.0):
         self.p = particle
         self.target = target
@@ -58,6 +153,9 @@ class Mouse(Force):
         self.k_s = k_s
         self.k_d = k_d
         
+    def kernel_args(self):
+        return (self.p.index, np.asarray(self.target, dtype=np.float64), float(self.k_s), float(self.k_d))
+        
     def apply(self, particles=None):
         # -----------------------------
         # TODO (5) : Implement Mouse Spring
@@ -74,13 +172,33 @@ class Mouse(Force):
          
         self.p.force += -f        
 
+    def jacobian(self, particles=None):
+        l = self.target - self.p.position
+        length = np.linalg.norm(l)
+        n = l / length if length >= 1e-6 else np.zeros(2)
+        
+        i = np.array([self.p.index])
+        K = -self.k_s * np.eye(2)[None]
+        D = self.k_d * np.outer(n, n)[None]
+        return i, i, K, D
+
 class Drag(Force):
+    kernel = 'drag'
+    
     def __init__(self, k_drag=0.1):
         self.k_drag = k_drag
         
+    def kernel_args(self):
+        return (float(self.k_drag),)
+        
     def apply(self, particles):
-        for p in particles:
-            # -----------------------
-            # TODO (Various Forces): Implement Drag
-            # -----------------------
-            p.force += -self.k_drag * p.velocity
\ No newline at end of file
+        # -----------------------
+        # TODO (Various Forces): Implement Drag
+        # -----------------------
+        particles.force -= self.k_drag * particles.velocity
+
+    def jacobian(self, particles):
+        i = np.arange(len(particles))
+        K = np.zeros((len(i), 2, 2))
+        D = np.broadcast_to(-self.k_drag * np.eye(2), K.shape)
+        return i, i, K, D
@@ -1,98 +1,305 @@
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.linalg import cg
+
 class Integrator:
     def solve(self, particle_system, time_step):
         pass
-    
+
+    def stage_buffers(self, num_particles, num_buffers):
+        """ Returns (N, 2) work buffers, reallocated only when the particle count changes. """
+        buffers = getattr(self, 'buffers', None)
+        if buffers is None or len(buffers) != num_buffers or buffers[0].shape[0] != num_particles:
+            self.buffers = [np.empty((num_particles, 2)) for _ in range(num_buffers)]
+        return self.buffers
+
+    @staticmethod
+    def advance(x, v, x0, v0, a, dt, dx=None):
+        """ x = x0 + dx * dt, v = v0 + a * dt in place, where dx defaults to the current velocity. """
+        np.multiply(v if dx is None else dx, dt, out=x)
+        x += x0
+        np.multiply(a, dt, out=v)
+        v += v0
+
 class Euler(Integrator):
     def solve(self, particle_system, time_step):
-        
+
         particle_system.evaluate_derivative()
-        
-        for p in particle_system.particles:
-            # -------------------------------------
-            # TODO (2): Implement Euler Integration
-            # -------------------------------------
-            a = p.force / p.mass
-            p.position += p.velocity * time_step
-            p.velocity += a * time_step
+
+        particles = particle_system.particles
+        # -------------------------------------
+        # TODO (2): Implement Euler Integration
+        # -------------------------------------
+        a = particles.force / particles.mass[:, None]
+        particles.position += particles.velocity * time_step
+        particles.velocity += a * time_step
 
 class ImplicitEuler(Integrator):
+    # Semi-implicit (symplectic) Euler: velocity first, then position with the new velocity.
+    # See BackwardEuler for the fully implicit method.
     def solve(self, particle_system, time_step):
-        
+
         particle_system.evaluate_derivative()
-        
-        for p in particle_system.particles:
-            # -------------------------------------
-            # TODO (2): Implement ImplicitEuler Integration
-            # -------------------------------------
-            a = p.force / p.mass
-            p.velocity += a * time_step
-            p.position += p.velocity * time_step
+
+        particles = particle_system.particles
+        # -------------------------------------
+        # TODO (2): Implement ImplicitEuler Integration
+        # -------------------------------------
+        a = particles.force / particles.mass[:, None]
+        particles.velocity += a * time_step
+        particles.position += particles.velocity * time_step
 
 class Midpoint(Integrator):
     def solve(self, particle_system, time_step):
         # -----------------------------
         # TODO (Numerical Method)
         # -----------------------------
+        particles = particle_system.particles
+        x, v = particles.position, particles.velocity
+        x0, v0, a = self.stage_buffers(len(particles), 3)
+
         # Save initial position and velocity
-        init_position = [p.position.copy() for p in particle_system.particles]
-        init_velocity = [p.velocity.copy() for p in particle_system.particles]        
-        
+        np.copyto(x0, x)
+        np.copyto(v0, v)
+
         particle_system.evaluate_derivative()
-        
+
         # Compute midpoint position and velocity
-        for p in particle_system.particles:
-            a = p.force / p.mass
-            p.position = p.position + p.velocity * time_step / 2
-            p.velocity = p.velocity + a * time_step / 2
-        
+        np.divide(particles.force, particles.mass[:, None], out=a)
+        self.advance(x, v, x0, v0, a, time_step / 2)
+
         # Compute forces at midpoint
         particle_system.evaluate_derivative()
-        
+
         # Compute final position and velocity
-        for i, p in enumerate(particle_system.particles):
-            a = p.force / p.mass
-            p.position = init_position[i] + p.velocity * time_step
-            p.velocity = init_velocity[i] + a * time_step
-        
+        np.divide(particles.force, particles.mass[:, None], out=a)
+        self.advance(x, v, x0, v0, a, time_step)
+
 class RK4(Integrator):
     def solve(self, particle_system, time_step):
         # -----------------------------
         # TODO (Numerical Method)
         # -----------------------------
+        # All stages write into preallocated buffers:
+        # k_x / k_v accumulate (k1 + 2 k2 + 2 k3 + k4) instead of storing each stage.
+        particles = particle_system.particles
+        x, v = particles.position, particles.velocity
+        x0, v0, a, k_x, k_v = self.stage_buffers(len(particles), 5)
+
         # Save initial position and velocity
-        init_position = [p.position.copy() for p in particle_system.particles]
-        init_velocity = [p.velocity.copy() for p in particle_system.particles]
-        
+        np.copyto(x0, x)
+        np.copyto(v0, v)
+
         # Step 1: Compute k1
         particle_system.evaluate_derivative()
-        k1_v = [p.force / p.mass for p in particle_system.particles]
-        k1_x = [p.velocity.copy() for p in particle_system.particles]
-        
+        np.divide(particles.force, particles.mass[:, None], out=a)
+        np.copyto(k_x, v)
+        np.copyto(k_v, a)
+
         # Step 2: Compute k2
-        for i, p in enumerate(particle_system.particles):
-            p.position = init_position[i] + k1_x[i] * (time_step / 2)
-            p.velocity = init_velocity[i] + k1_v[i] * (time_step / 2)
+        self.advance(x, v, x0, v0, a, time_step / 2)
         particle_system.evaluate_derivative()
-        k2_v = [p.force / p.mass for p in particle_system.particles]
-        k2_x = [p.velocity.copy() for p in particle_system.particles]
-        
+        np.divide(particles.force, particles.mass[:, None], out=a)
+        k_x += v
+        k_x += v
+        k_v += a
+        k_v += a
+
         # Step 3: Compute k3
-        for i, p in enumerate(particle_system.particles):
-            p.position = init_position[i] + k2_x[i] * (time_step / 2)
-            p.velocity = init_velocity[i] + k2_v[i] * (time_step / 2)
+        self.advance(x, v, x0, v0, a, time_step / 2)
         particle_system.evaluate_derivative()
-        k3_v = [p.force / p.mass for p in particle_system.particles]
-        k3_x = [p.velocity.copy() for p in particle_system.particles]
-        
+        np.divide(particles.force, particles.mass[:, None], out=a)
+        k_x += v
+        k_x += v
+        k_v += a
+        k_v += a
+
         # Step 4: Compute k4
-        for i, p in enumerate(particle_system.particles):
-            p.position = init_position[i] + k3_x[i] * time_step
-            p.velocity = init_velocity[i] + k3_v[i] * time_step
+        self.advance(x, v, x0, v0, a, time_step)
         particle_system.evaluate_derivative()
-        k4_v = [p.force / p.mass for p in particle_system.particles]
-        k4_x = [p.velocity.copy() for p in particle_system.particles]
-        
+        np.divide(particles.force, particles.mass[:, None], out=a)
+        k_x += v
+        k_v += a
+
         # Final update
-        for i, p in enumerate(particle_system.particles):
-            p.position = init_position[i] + (time_step / 6) * (k1_x[i] + 2 * k2_x[i] + 2 * k3_x[i] + k4_x[i])
-            p.velocity = init_velocity[i] + (time_step / 6) * (k1_v[i] + 2 * k2_v[i] + 2 * k3_v[i] + k4_v[i])
+        self.advance(x, v, x0, v0, k_v, time_step / 6, k_x)
+
+class DormandPrince(Integrator):
+    """
+    Adaptive Runge-Kutta 5(4) (Dormand-Prince) integrator.
+
+    solve() advances the full frame time with as many sub-steps as the error tolerance requires.
+    The embedded 4th-order solution gives the error estimate; the last accepted sub-step is reused
+    as the first guess of the next frame. num_evaluations / num_substeps / num_rejected report the
+    work done by the last call.
+    """
+    C = [0.0, 1/5, 3/10, 4/5, 8/9, 1.0, 1.0]
+    A = [
+        [],
+        [1/5],
+        [3/40, 9/40],
+        [44/45, -56/15, 32/9],
+        [19372/6561, -25360/2187, 64448/6561, -212/729],
+        [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+        [35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84],
+    ]
+    # Difference between the 5th-order (last row of A) and the embedded 4th-order weights
+    E = [35/384 - 5179/57600, 0.0, 500/1113 - 7571/16695, 125/192 - 393/640,
+         -2187/6784 + 92097/339200, 11/84 - 187/2100, -1/40]
+
+    def __init__(self, rtol=1e-3, atol=1e-2, min_step=1e-5, max_substeps=1000, safety=0.9):
+        self.rtol = rtol
+        self.atol = atol
+        self.min_step = min_step
+        self.max_substeps = max_substeps
+        self.safety = safety
+
+        self.h = None
+        self.num_evaluations = 0
+        self.num_substeps = 0
+        self.num_rejected = 0
+
+    def solve(self, particle_system, time_step):
+        particles = particle_system.particles
+        x, v = particles.position, particles.velocity
+        n = len(particles)
+        buffers = self.stage_buffers(n, 2 * 7 + 4)
+        x0, v0, err_x, err_v = buffers[:4]
+        k_x, k_v = buffers[4:11], buffers[11:18]
+
+        self.num_evaluations = self.num_substeps = self.num_rejected = 0
+
+        np.copyto(x0, x)
+        np.copyto(v0, v)
+        self.evaluate(particle_system, k_x[0], k_v[0])
+
+        t = 0.0
+        h = time_step if self.h is None else min(self.h, time_step)
+        while time_step - t > 1e-12 and self.num_substeps + self.num_rejected < self.max_substeps:
+            h = min(h, time_step - t)
+
+            # Stages 2..7; stage 7 is evaluated at the 5th-order solution (FSAL)
+            for s in range(1, 7):
+                self.combine(x, x0, k_x, self.A[s], h, err_x)
+                self.combine(v, v0, k_v, self.A[s], h, err_v)
+                self.evaluate(particle_system, k_x[s], k_v[s])
+
+            # Error estimate, scaled per component
+            error = max(self.error_norm(x, x0, k_x, h, err_x), self.error_norm(v, v0, k_v, h, err_v))
+
+            if error <= 1.0 or h <= self.min_step:
+                # Accept: the 5th-order solution is already in x, v
+                t += h
+                self.num_substeps += 1
+                np.copyto(x0, x)
+                np.copyto(v0, v)
+                k_x[0], k_x[6] = k_x[6], k_x[0]
+                k_v[0], k_v[6] = k_v[6], k_v[0]
+            else:
+                # Reject: k1 is still the derivative at (x0, v0)
+                self.num_rejected += 1
+                np.copyto(x, x0)
+                np.copyto(v, v0)
+
+            factor = self.safety * error ** (-1 / 5) if error > 0 else 5.0
+            h = max(h * min(5.0, max(0.2, factor)), self.min_step)
+
+        # Remember the step size for the next frame (the last one is usually clipped to the frame end)
+        self.h = h
+
+    def evaluate(self, particle_system, k_x, k_v):
+        particles = particle_system.particles
+        particle_system.evaluate_derivative()
+        np.copyto(k_x, particles.velocity)
+        np.divide(particles.force, particles.mass[:, None], out=k_v)
+        self.num_evaluations += 1
+
+    @staticmethod
+    def combine(y, y0, k, coefficients, h, tmp):
+        """ y = y0 + h * sum_j coefficients[j] * k[j] in place. """
+        np.copyto(y, y0)
+        for c, k_j in zip(coefficients, k):
+            if c != 0.0:
+                np.multiply(k_j, h * c, out=tmp)
+                y += tmp
+
+    def error_norm(self, y, y0, k, h, err):
+        err.fill(0.0)
+        for e, k_j in zip(self.E, k):
+            if e != 0.0:
+                err += (h * e) * k_j
+        scale = self.atol + self.rtol * np.maximum(np.abs(y0), np.abs(y))
+        return np.max(np.abs(err) / scale) if err.size else 0.0
+
+class BackwardEuler(Integrator):
+    """
+    Backward (fully implicit) Euler, linearized once per step (Baraff & Witkin 1998).
+
+    Solves (M - h df/dv - h^2 df/dx) dv = h (f + h df/dx v) with conjugate gradient, using the
+    sparse Jacobian blocks returned by Force.jacobian. Attached particles are filtered out of the
+    system, and the previous dv warm-starts the next solve.
+    """
+    def __init__(self, tolerance=1e-6, max_iterations=200):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+        self.dv = None
+        self.num_iterations = 0
+
+    def solve(self, particle_system, time_step):
+        h = time_step
+        particles = particle_system.particles
+        n = len(particles)
+        
+        particle_system.evaluate_derivative()
+        
+        df_dx, df_dv = self.assemble_jacobian(particle_system)
+        v0 = particles.velocity.reshape(-1)
+        f0 = particles.force.reshape(-1)
+        
+        # Attached particles (infinite mass) keep their velocity: dv = 0 on those DoFs
+        free = np.repeat(np.isfinite(particles.mass), 2)
+        mass = np.where(free, np.repeat(particles.mass, 2), 1.0)
+        S = sparse.diags(free.astype(np.float64))
+        
+        A = sparse.diags(mass) - h * df_dv - h * h * df_dx
+        A = S @ A @ S + sparse.diags((~free).astype(np.float64))
+        b = np.where(free, h * (f0 + h * (df_dx @ v0)), 0.0)
+        
+        x0 = self.dv if self.dv is not None and self.dv.shape == b.shape else None
+        
+        self.num_iterations = 0
+        def count(_):
+            self.num_iterations += 1
+        dv, _ = cg(A.tocsr(), b, x0=x0, rtol=self.tolerance, maxiter=self.max_iterations, callback=count)
+        self.dv = dv
+        
+        particles.velocity += dv.reshape(n, 2)
+        particles.position += particles.velocity * h
+
+    def assemble_jacobian(self, particle_system):
+        """ Sums the 2x2 blocks of every force into (2N, 2N) sparse df/dx and df/dv. """
+        particles = particle_system.particles
+        rows, cols, values_x, values_v = [], [], [], []
+        for force in particle_system.forces:
+            blocks = force.jacobian(particles)
+            if blocks is None:
+                continue
+            i, j, K, D = blocks
+            
+            # Expand particle blocks into scalar entries over DoFs (2 * particle + axis)
+            r = (2 * i[:, None, None] + np.arange(2)[None, :, None]) + np.zeros((1, 1, 2), dtype=np.int64)
+            c = (2 * j[:, None, None] + np.arange(2)[None, None, :]) + np.zeros((1, 2, 1), dtype=np.int64)
+            rows.append(r.reshape(-1))
+            cols.append(c.reshape(-1))
+            values_x.append(np.asarray(K, dtype=np.float64).reshape(-1))
+            values_v.append(np.asarray(D, dtype=np.float64).reshape(-1))
+        
+        shape = (2 * len(particles), 2 * len(particles))
+        if not rows:
+            return sparse.csr_matrix(shape), sparse.csr_matrix(shape)
+        
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        df_dx = sparse.coo_matrix((np.concatenate(values_x), (rows, cols)), shape=shape).tocsr()
+        df_dv = sparse.coo_matrix((np.concatenate(values_v), (rows, cols)), shape=shape).tocsr()
+        return df_dx, df_dv
@@ -0,0 +1,135 @@
+"""
+Compiled force kernels.
+
+The NumPy apply() of each force in Forces.py is the reference implementation. A force whose
+`kernel` name has a kernel registered for the active backend is dispatched to it instead, on the
+raw particle arrays: kernel(position, velocity, mass, force, *params) adds its contribution into
+`force` in place. Backends:
+- 'numpy' : no kernels, every force uses its apply()
+- 'numba' : compiled loops, used when numba is installed. Compiled code is cached on disk
+            (numba's cache=True, in __pycache__), so only the very first run pays for the JIT.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+KERNELS = {}
+BACKEND = 'numba' if numba is not None else 'numpy'
+
+
+def register_kernel(name, backend='numba'):
+    def decorator(function):
+        if backend == 'numba':
+            if numba is None:
+                return function
+            function = numba.njit(cache=True)(function)
+        KERNELS.setdefault(name, {})[backend] = function
+        return function
+    return decorator
+
+
+def get_kernel(name, backend=None):
+    """ The kernel registered for the requested (default: active) backend, or None. """
+    return KERNELS.get(name, {}).get(backend or BACKEND)
+
+
+def set_backend(backend):
+    global BACKEND
+    if backend == 'numba' and numba is None:
+        raise ImportError("numba is not installed")
+    BACKEND = backend
+
+
+def warm_up():
+    """ Compiles (or loads from the disk cache) every kernel of the active backend on a tiny problem. """
+    x = np.zeros((2, 2))
+    v = np.zeros((2, 2))
+    m = np.ones(2)
+    f = np.zeros((2, 2))
+    edges = np.array([[0, 1]], dtype=np.int64)
+    params = np.ones(1)
+    args = {
+        'gravity': (np.zeros(2),),
+        'drag': (0.0,),
+        'spring': (0, 1, 1.0, 1.0, 1.0),
+        'spring_network': (edges, params, params, params),
+        'mouse': (0, np.ones(2), 1.0, 1.0),
+    }
+    for name, kernel_args in args.items():
+        kernel = get_kernel(name)
+        if kernel is not None:
+            kernel(x, v, m, f, *kernel_args)
+
+
+# =============================
+# Numba
+# =============================
+@register_kernel('gravity', backend='numba')
+def gravity_numba(position, velocity, mass, force, G):
+    for p in range(force.shape[0]):
+        if np.isinf(mass[p]):
+            continue
+        force[p, 0] += mass[p] * G[0]
+        force[p, 1] += mass[p] * G[1]
+
+
+@register_kernel('drag', backend='numba')
+def drag_numba(position, velocity, mass, force, k_drag):
+    for p in range(force.shape[0]):
+        force[p, 0] -= k_drag * velocity[p, 0]
+        force[p, 1] -= k_drag * velocity[p, 1]
+
+
+@register_kernel('spring', backend='numba')
+def spring_numba(position, velocity, mass, force, i, j, k_s, k_d, l0):
+    lx = position[i, 0] - position[j, 0]
+    ly = position[i, 1] - position[j, 1]
+    length = np.sqrt(lx * lx + ly * ly)
+    if length < 1e-6:
+        return
+
+    l_dot = (velocity[i, 0] - velocity[j, 0]) * lx + (velocity[i, 1] - velocity[j, 1]) * ly
+    magnitude = -(k_s * (length - l0) + k_d * l_dot / length) / length
+
+    force[i, 0] += magnitude * lx
+    force[i, 1] += magnitude * ly
+    force[j, 0] -= magnitude * lx
+    force[j, 1] -= magnitude * ly
+
+
+@register_kernel('spring_network', backend='numba')
+def spring_network_numba(position, velocity, mass, force, edges, k_s, k_d, l0):
+    for e in range(edges.shape[0]):
+        i, j = edges[e, 0], edges[e, 1]
+        lx = position[i, 0] - position[j, 0]
+        ly = position[i, 1] - position[j, 1]
+        length = np.sqrt(lx * lx + ly * ly)
+        if length < 1e-6:
+            continue
+
+        l_dot = (velocity[i, 0] - velocity[j, 0]) * lx + (velocity[i, 1] - velocity[j, 1]) * ly
+        magnitude = -(k_s[e] * (length - l0[e]) + k_d[e] * l_dot / length) / length
+
+        force[i, 0] += magnitude * lx
+        force[i, 1] += magnitude * ly
+        force[j, 0] -= magnitude * lx
+        force[j, 1] -= magnitude * ly
+
+
+@register_kernel('mouse', backend='numba')
+def mouse_numba(position, velocity, mass, force, i, target, k_s, k_d):
+    lx = target[0] - position[i, 0]
+    ly = target[1] - position[i, 1]
+    length = np.sqrt(lx * lx + ly * ly)
+    if length < 1e-6:
+        return
+
+    l_dot = velocity[i, 0] * lx + velocity[i, 1] * ly
+    magnitude = (k_s * length + k_d * l_dot / length) / length
+
+    force[i, 0] += magnitude * lx
+    force[i, 1] += magnitude * ly
@@ -2,35 +2,215 @@ from typing import List, Optional
 import numpy as np
 from Forces import *
 from Integrators import *
+from Kernels import get_kernel
+from SpatialHash import SpatialHash
+
+def dot_rows(a, b):
+    """ Row-wise np.dot of (N, 2) `a` with a single 2-vector `b`. A stacked matmul rounds exactly like np.dot. """
+    return np.matmul(a[:, None, :], b)[:, 0]
+
 
 class Particle:
+    """ Lightweight view into row `index` of a ParticleStore. """
     def __init__(self, pos, mass=1.0, radius=5.0):
-        self.position = pos
-        self.velocity = np.array([0.0, 0.0], dtype=np.float32)
-        self.force = np.array([0.0, 0.0], dtype=np.float32)
-        self.mass = mass
-        
-        self.radius = radius
-        self.inital_position = pos.copy()
-        self.inital_mass = mass
-        
-        
+        # Until it is added to a ParticleSystem, a particle owns a single-row store
+        self.store = ParticleStore(capacity=1)
+        self.index = self.store.append(pos, mass, radius)
+        self.store.views.append(self)
+
+    def bind(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def position(self):
+        return self.store._position[self.index]
+
+    @position.setter
+    def position(self, value):
+        self.store._position[self.index] = value
+        self.store.version += 1
+
+    @property
+    def velocity(self):
+        return self.store._velocity[self.index]
+
+    @velocity.setter
+    def velocity(self, value):
+        self.store._velocity[self.index] = value
+
+    @property
+    def force(self):
+        return self.store._force[self.index]
+
+    @force.setter
+    def force(self, value):
+        self.store._force[self.index] = value
+
+    @property
+    def mass(self):
+        return self.store._mass[self.index]
+
+    @mass.setter
+    def mass(self, value):
+        self.store._mass[self.index] = value
+
+    @property
+    def radius(self):
+        return self.store._radius[self.index]
+
+    @radius.setter
+    def radius(self, value):
+        self.store._radius[self.index] = value
+
+    @property
+    def inital_position(self):
+        return self.store._initial_position[self.index]
+
+    @property
+    def inital_mass(self):
+        return self.store._initial_mass[self.index]
+
     def clear_force(self):
-        self.force = np.array([0.0, 0.0], dtype=np.float32)
+        self.force = 0.0
 
     def reset(self):
-        self.position = self.inital_position.copy()
-        self.velocity = np.zeros_like(self.position)
+        self.position = self.inital_position
+        self.velocity = 0.0
         self.clear_force()
     
     def is_attached(self):
         return np.isinf(self.mass)
 
+
+class ParticleStore:
+    """
+    Structure-of-arrays storage for all particles of a system.
+    
+    position, velocity and force are contiguous (N, 2) arrays and mass, radius are (N,) arrays,
+    so forces and integrators can operate on every particle at once. Indexing or iterating
+    yields the Particle views, which keeps per-particle code (rendering, mouse interaction) working.
+    """
+    def __init__(self, capacity=16):
+        self.n = 0
+        # Incremented whenever positions change, so spatial indices know when to rebuild
+        self.version = 0
+        self.views : List[Particle] = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grow(old, shape):
+            new = np.zeros(shape, dtype=np.float64)
+            if old is not None:
+                new[:self.n] = old[:self.n]
+            return new
+        
+        self._position         = grow(getattr(self, '_position', None),         (capacity, 2))
+        self._velocity         = grow(getattr(self, '_velocity', None),         (capacity, 2))
+        self._force            = grow(getattr(self, '_force', None),            (capacity, 2))
+        self._mass             = grow(getattr(self, '_mass', None),             (capacity,))
+        self._radius           = grow(getattr(self, '_radius', None),           (capacity,))
+        self._initial_position = grow(getattr(self, '_initial_position', None), (capacity, 2))
+        self._initial_mass     = grow(getattr(self, '_initial_mass', None),     (capacity,))
+        self.capacity = capacity
+
+    def append(self, pos, mass=1.0, radius=5.0, velocity=0.0):
+        if self.n == self.capacity:
+            self._allocate(2 * self.capacity)
+        
+        i = self.n
+        self._position[i] = pos
+        self._velocity[i] = velocity
+        self._force[i] = 0.0
+        self._mass[i] = mass
+        self._radius[i] = radius
+        self._initial_position[i] = pos
+        self._initial_mass[i] = mass
+        self.n += 1
+        self.version += 1
+        return i
+
+    def add(self, particle):
+        """ Copies the particle's row into this store and rebinds it as a view. """
+        src, j = particle.store, particle.index
+        i = self.append(src._position[j], src._mass[j], src._radius[j], src._velocity[j])
+        self._initial_position[i] = src._initial_position[j]
+        self._initial_mass[i] = src._initial_mass[j]
+        particle.bind(self, i)
+        self.views.append(particle)
+
+    # Views of the active rows
+    @property
+    def position(self):
+        return self._position[:self.n]
+
+    @position.setter
+    def position(self, value):
+        self._position[:self.n] = value
+        self.version += 1
+
+    @property
+    def velocity(self):
+        return self._velocity[:self.n]
+
+    @velocity.setter
+    def velocity(self, value):
+        self._velocity[:self.n] = value
+
+    @property
+    def force(self):
+        return self._force[:self.n]
+
+    @force.setter
+    def force(self, value):
+        self._force[:self.n] = value
+
+    @property
+    def mass(self):
+        return self._mass[:self.n]
+
+    @mass.setter
+    def mass(self, value):
+        self._mass[:self.n] = value
+
+    @property
+    def radius(self):
+        return self._radius[:self.n]
+
+    @radius.setter
+    def radius(self, value):
+        self._radius[:self.n] = value
+
+    @property
+    def initial_position(self):
+        return self._initial_position[:self.n]
+
+    @property
+    def initial_mass(self):
+        return self._initial_mass[:self.n]
+
+    def clear_force(self):
+        self.force[:] = 0.0
+
+    def reset(self):
+        self.position = self.initial_position
+        self.velocity[:] = 0.0
+        self.clear_force()
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __getitem__(self, i):
+        return self.views[i]
+
 class ParticleSystem:
     def __init__(self, integrator=None, renderer=None):
             
         # Particle System
-        self.particles  : List[Particle]       = []        
+        self.particles  : ParticleStore        = ParticleStore()
         self.forces     : List[Force]          = []
         
         # Differential Equation Solver
@@ -44,6 +224,17 @@ class ParticleSystem:
             'restitution' : 0.3,
         }
         self.edges = []
+        
+        # Particle-Particle Collision
+        self.particle_collision = {
+            'enabled' : False,
+            'restitution' : 0.3,
+        }
+        self.spatial_hash = SpatialHash()
+        
+        # Picking index, rebuilt lazily when particles have moved
+        self.pick_index = SpatialHash()
+        self.pick_version = None
 
         
         # Mouse Interaction
@@ -61,7 +252,7 @@ class ParticleSystem:
         
     def add_particle(self, particle):
         if isinstance(particle, Particle):
-            self.particles.append(particle)
+            self.particles.add(particle)
     
     def add_force(self, force):
         if isinstance(force, Force):
@@ -78,11 +269,17 @@ class ParticleSystem:
         # - Loop over particles, zero force accumulators
         # - Calculate forces by invoking apply functions, sum all forces into accumulators
         # -----------------------------
-        for p in self.particles:
-            p.clear_force()
+        self.particles.clear_force()
         
+        # Forces with a kernel registered for the active backend are dispatched directly on the
+        # particle arrays; the others use their NumPy apply()
+        x, v, m, force = self.particles.position, self.particles.velocity, self.particles.mass, self.particles.force
         for f in self.forces:
-            f.apply(self.particles) 
+            kernel = get_kernel(f.kernel) if f.kernel is not None else None
+            if kernel is not None:
+                kernel(x, v, m, force, *f.kernel_args())
+            else:
+                f.apply(self.particles)
             
         # (3) Contact force
         self.contact_during_ode()         
@@ -92,47 +289,119 @@ class ParticleSystem:
             return
         self.integrator.solve(self, time_step)
         self.collision_after_ode()
+        self.particles.version += 1
                         
     def contact_during_ode(self):
-        for p in self.particles:
-            x, v = p.position, p.velocity   
-            n, o = self.ground['normal'], self.ground['origin']
-            k_f = self.ground['friction']
+        if self.ground is None:
+            return
         
-            penetration_depth = np.dot(x - o, n) - p.radius
-            
-            # No collision
-            if penetration_depth > 1e-3:
-                continue
-            
-            # Resting Contact
-            # --------------------------
-            # TODO (Collision) : Implement Resting Contact
-            # --------------------------
-            if np.abs(np.dot(v, n)) < 1e-3:
-                if np.dot(n, p.force) < 0:
-                    p.force += np.dot(-n, p.force) * n
-                    
-                    v_tangent = v - np.dot(v, n) * n
-                    p.force += -k_f * np.dot(-n, p.force) * v_tangent
+        particles = self.particles
+        x, v, f = particles.position, particles.velocity, particles.force
+        n, o = self.ground['normal'], self.ground['origin']
+        k_f = self.ground['friction']
+        
+        penetration_depth = dot_rows(x - o, n) - particles.radius
+        
+        # Resting Contact: touching the ground, no normal velocity and pushed into the ground
+        # --------------------------
+        # TODO (Collision) : Implement Resting Contact
+        # --------------------------
+        v_n = dot_rows(v, n)
+        resting = ~(penetration_depth > 1e-3) & (np.abs(v_n) < 1e-3) & (dot_rows(f, n) < 0)
+        if not resting.any():
+            return
+        
+        f_c = f[resting]
+        f_c += dot_rows(f_c, -n)[:, None] * n
+        
+        v_tangent = v[resting] - v_n[resting, None] * n
+        f_c += -k_f * dot_rows(f_c, -n)[:, None] * v_tangent
+        f[resting] = f_c
         
     def collision_after_ode(self,):
-        for p in self.particles:
-            x, v = p.position, p.velocity   
-            n, o = self.ground['normal'], self.ground['origin']
-            k_r = self.ground['restitution']
-            
-            depth = np.dot(x - o, n) - p.radius
-            if depth < 0:
-                # --------------------------
-                # TODO (Collision) : Implement Collision Response
-                # --------------------------
-                v_normal = np.dot(v, n) * n
-                v_tangent = v - v_normal
-                
-                p.position -= depth * n
-                p.velocity = v_tangent - k_r * v_normal
+        if self.ground is not None:
+            self.ground_collision()
+        
+        if self.particle_collision['enabled']:
+            self.particle_particle_collision()
+    
+    def ground_collision(self):
+        particles = self.particles
+        x, v = particles.position, particles.velocity
+        n, o = self.ground['normal'], self.ground['origin']
+        k_r = self.ground['restitution']
+        
+        depth = dot_rows(x - o, n) - particles.radius
+        colliding = depth < 0
+        if not colliding.any():
+            return
+        
+        # --------------------------
+        # TODO (Collision) : Implement Collision Response
+        # --------------------------
+        v_c = v[colliding]
+        v_normal = dot_rows(v_c, n)[:, None] * n
+        v_tangent = v_c - v_normal
+        
+        x[colliding] -= depth[colliding, None] * n
+        v[colliding] = v_tangent - k_r * v_normal
+
+    def particle_particle_collision(self):
+        particles = self.particles
+        if len(particles) < 2:
+            return
+        x, v = particles.position, particles.velocity
+        radius = particles.radius
+        k_r = self.particle_collision['restitution']
+        
+        # Broad phase: a cell as wide as the largest particle diameter only needs its neighbouring cells
+        self.spatial_hash.build(x, cell_size=2.0 * radius.max())
+        i, j = self.spatial_hash.candidate_pairs()
+        
+        # Narrow phase
+        d = x[i] - x[j]
+        dist = np.sqrt(np.einsum('ij,ij->i', d, d))
+        hit = (dist < radius[i] + radius[j]) & (dist > 1e-9)
+        
+        # Attached particles (infinite mass) do not move
+        w = np.where(np.isfinite(particles.mass), 1.0 / particles.mass, 0.0)
+        w_sum = w[i] + w[j]
+        hit &= w_sum > 0
+        if not hit.any():
+            return
+        i, j, d, dist, w_sum = i[hit], j[hit], d[hit], dist[hit], w_sum[hit]
+        n = d / dist[:, None]
+        
+        # Push overlapping particles apart, weighted by inverse mass
+        penetration = radius[i] + radius[j] - dist
+        dx = (penetration / w_sum)[:, None] * n
+        
+        # Restitution impulse on approaching pairs
+        v_n = np.einsum('ij,ij->i', v[i] - v[j], n)
+        impulse = np.where(v_n < 0, -(1 + k_r) * v_n / w_sum, 0.0)
+        dv = impulse[:, None] * n
+        
+        # Accumulate every contact of a particle (a particle can touch several others)
+        num = len(particles)
+        for axis in range(2):
+            x[:, axis] += w * (np.bincount(i, weights=dx[:, axis], minlength=num) - np.bincount(j, weights=dx[:, axis], minlength=num))
+            v[:, axis] += w * (np.bincount(i, weights=dv[:, axis], minlength=num) - np.bincount(j, weights=dv[:, axis], minlength=num))
                                     
+    def simulate(self, num_steps, time_step, record_every=1):
+        """
+        Runs the system without a renderer.
+        Returns the recorded positions, shape (num_steps // record_every + 1, N, 2), initial state first.
+        """
+        self.playing = True
+        frames = np.empty((num_steps // record_every + 1, len(self.particles), 2))
+        frames[0] = self.particles.position
+        
+        for s in range(1, num_steps + 1):
+            self.step(time_step)
+            if s % record_every == 0:
+                frames[s // record_every] = self.particles.position
+        return frames
+
     def render(self,):
         self.renderer.render()
 
@@ -179,13 +448,39 @@ class ParticleSystem:
             self.grab_force = None
         self.grabbed_particle = None
     
+    def get_pick_index(self):
+        if self.pick_version != self.particles.version:
+            cell_size = 2.0 * self.particles.radius.max() if len(self.particles) else 1.0
+            self.pick_index.build(self.particles.position, cell_size)
+            self.pick_version = self.particles.version
+        return self.pick_index
+    
     def get_nearest_particle(self, mouse_pose):
-        x, y = mouse_pose
-        min_dist = np.inf
-        nearest_particle = None
-        for p in self.particles:
-            dist = np.linalg.norm(p.position - np.array([x, y]))
-            if dist < min_dist and dist < p.radius:
-                min_dist = dist
-                nearest_particle = p
-        return nearest_particle
\ No newline at end of file
+        if len(self.particles) == 0:
+            return None
+        
+        x = np.asarray(mouse_pose, dtype=np.float64)
+        radius = self.particles.radius
+        candidates = self.get_pick_index().query_radius(x, radius.max())
+        
+        dist = np.linalg.norm(self.particles.position[candidates] - x, axis=1)
+        inside = dist < radius[candidates]
+        if not inside.any():
+            return None
+        candidates, dist = candidates[inside], dist[inside]
+        return self.particles[candidates[np.argmin(dist)]]
+    
+    def select_box(self, corner1, corner2):
+        """ Particles whose centers lie inside the box spanned by two corners. """
+        lo, hi = np.minimum(corner1, corner2), np.maximum(corner1, corner2)
+        candidates = self.get_pick_index().query_box(lo, hi)
+        x = self.particles.position[candidates]
+        inside = np.all((x >= lo) & (x <= hi), axis=1)
+        return [self.particles[i] for i in candidates[inside]]
+    
+    def select_lasso(self, polygon):
+        """ Particles whose centers lie inside a closed polygon drawn with the mouse. """
+        if len(polygon) < 3:
+            return []
+        selected = self.get_pick_index().query_polygon(polygon, self.particles.position)
+        return [self.particles[i] for i in selected]
@@ -41,8 +41,7 @@ class Renderer2D:
                     self.ps.running = False
                     
                 if event.key == K_r:
-                    for p in self.ps.particles:
-                        p.reset()
+                    self.ps.particles.reset()
                     self.ps.playing = False
                     
                 if event.key == K_d and pygame.key.get_mods() & KMOD_CTRL:
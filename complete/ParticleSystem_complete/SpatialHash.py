@@ -0,0 +1,105 @@
+import numpy as np
+
+# Half of the 3x3 neighbourhood: every pair of neighbouring cells is visited exactly once
+HALF_NEIGHBORHOOD = np.array([[1, -1], [1, 0], [1, 1], [0, 1]], dtype=np.int64)
+
+
+def cell_keys(cells):
+    """ Packs integer (x, y) cell coordinates into one sortable int64 key. """
+    return (cells[..., 0] << 32) + (cells[..., 1] + (1 << 31))
+
+
+def expand_ranges(lo, hi):
+    """ For ranges [lo[k], hi[k]) returns (k, i) for every i in every range, without a Python loop. """
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, lo[owner] + offset
+
+
+class SpatialHash:
+    """
+    Uniform grid over 2D points, stored as points sorted by cell key.
+
+    build() is one sort of the cell keys per step; lookups of a cell are binary searches
+    into the sorted keys, so no per-cell Python containers are created.
+    """
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cells = np.zeros((0, 2), dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+
+    def build(self, positions, cell_size=None):
+        if cell_size is not None:
+            self.cell_size = cell_size
+        self.cells = np.floor(positions / self.cell_size).astype(np.int64)
+        keys = cell_keys(self.cells)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        return self
+
+    def cell_range(self, cells):
+        """ [start, end) into the sorted points for each cell in `cells` (..., 2). """
+        keys = cell_keys(cells)
+        return np.searchsorted(self.sorted_keys, keys, 'left'), np.searchsorted(self.sorted_keys, keys, 'right')
+
+    def candidate_pairs(self):
+        """ Index pairs (i, j) of points in the same or in neighbouring cells, each pair once. """
+        sorted_cells = self.cells[self.order]
+        sorted_index = np.arange(len(self.order))
+        first, second = [], []
+
+        # Same cell: pair each point with the points after it in the cell
+        _, end = self.cell_range(sorted_cells)
+        a, b = expand_ranges(sorted_index + 1, end)
+        first.append(a)
+        second.append(b)
+
+        # Neighbouring cells: all points of the cell at the offset
+        for offset in HALF_NEIGHBORHOOD:
+            lo, hi = self.cell_range(sorted_cells + offset)
+            a, b = expand_ranges(lo, hi)
+            first.append(a)
+            second.append(b)
+
+        first, second = np.concatenate(first), np.concatenate(second)
+        return self.order[first], self.order[second]
+
+    def query_box(self, lo, hi):
+        """ Candidate indices of the points in the cells overlapping the box [lo, hi] (a superset). """
+        lo, hi = np.minimum(lo, hi), np.maximum(lo, hi)
+        cell_lo = np.floor(np.asarray(lo) / self.cell_size).astype(np.int64)
+        cell_hi = np.floor(np.asarray(hi) / self.cell_size).astype(np.int64)
+        num_cells = np.prod(cell_hi - cell_lo + 1)
+        
+        if num_cells > len(self.order):
+            # The box covers more cells than there are points: a direct scan is cheaper
+            candidates = np.arange(len(self.order))
+        else:
+            # One contiguous key range per cell column
+            columns = np.arange(cell_lo[0], cell_hi[0] + 1)
+            start, _ = self.cell_range(np.stack([columns, np.full_like(columns, cell_lo[1])], axis=-1))
+            _, end = self.cell_range(np.stack([columns, np.full_like(columns, cell_hi[1])], axis=-1))
+            _, sorted_index = expand_ranges(start, end)
+            candidates = self.order[sorted_index]
+        return candidates
+
+    def query_radius(self, point, radius):
+        """ Candidate indices of the points within `radius` of `point` (a superset; filter by distance). """
+        point = np.asarray(point, dtype=np.float64)
+        return self.query_box(point - radius, point + radius)
+
+    def query_polygon(self, polygon, positions):
+        """ Indices of the points inside a closed polygon (lasso), given the positions the grid was built from. """
+        polygon = np.asarray(polygon, dtype=np.float64)
+        candidates = self.query_box(polygon.min(axis=0), polygon.max(axis=0))
+        
+        # Even-odd rule, vectorized over candidates and polygon edges
+        p = positions[candidates][:, None, :]
+        a, b = polygon[None, :, :], np.roll(polygon, -1, axis=0)[None, :, :]
+        crosses = (a[..., 1] > p[..., 1]) != (b[..., 1] > p[..., 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = a[..., 0] + (p[..., 1] - a[..., 1]) * (b[..., 0] - a[..., 0]) / (b[..., 1] - a[..., 1])
+        inside = np.count_nonzero(crosses & (p[..., 0] < x_cross), axis=1) % 2 == 1
+        return candidates[inside]
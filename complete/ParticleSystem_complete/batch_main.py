@@ -0,0 +1,123 @@
+"""
+Headless batch runner: simulates many cloth configurations in parallel without opening a window.
+
+Every combination of the swept parameters becomes one scene. Each scene runs in a worker process
+and its trajectory is written to <out>/<name>.npz (positions, edges and the scene config).
+
+    python batch_main.py --k_s 50 100 200 --k_d 1 2 --k_drag 0.05 0.1 --steps 300 --workers 8
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import Integrators
+from Forces import Gravity, SpringNetwork, Drag
+from ParticleSystem import ParticleSystem, Particle
+
+
+def build_cloth(config):
+    """ Same scene as main.py: a grid of particles connected by springs, under gravity and drag. """
+    ps = ParticleSystem()
+    ps.integrator = getattr(Integrators, config["integrator"])()
+    ps.ground.update({
+        'normal' : np.array([0.0, 1.0], dtype=np.float32),
+        'origin' : np.array([0.0, config["ground"]], dtype=np.float32),
+    })
+
+    width, height, spacing = config["width"], config["height"], config["spacing"]
+    for i in range(width):
+        for j in range(height):
+            ps.add_particle(Particle(np.array([i * spacing, j * spacing], dtype=np.float32)))
+
+    for i in range(width):
+        for j in range(height):
+            if i < width - 1:
+                ps.edges.append((i * height + j, (i + 1) * height + j))
+            if j < height - 1:
+                ps.edges.append((i * height + j, i * height + j + 1))
+
+    ps.add_force(Gravity(gravity=np.array([0, -9.8])))
+    ps.add_force(SpringNetwork(ps.edges, config["k_s"], config["k_d"], spacing))
+    ps.add_force(Drag(k_drag=config["k_drag"]))
+
+    # Optionally pin the two top corners
+    if config["pin_corners"]:
+        for i in (0, width - 1):
+            ps.attach_particle(ps.particles[i * height + height - 1].position.copy())
+    return ps
+
+
+def run_scene(config, out_dir):
+    start = time.perf_counter()
+    ps = build_cloth(config)
+    frames = ps.simulate(config["steps"], config["time_step"], config["record_every"])
+
+    path = os.path.join(out_dir, config["name"] + ".npz")
+    np.savez_compressed(path, positions=frames.astype(np.float32), edges=np.array(ps.edges), config=json.dumps(config))
+    return config["name"], path, time.perf_counter() - start
+
+
+def make_configs(args):
+    configs = []
+    sweep = itertools.product(args.k_s, args.k_d, args.k_drag)
+    for index, (k_s, k_d, k_drag) in enumerate(sweep):
+        configs.append({
+            "name": f"scene_{index:04d}_ks{k_s:g}_kd{k_d:g}_drag{k_drag:g}",
+            "k_s": k_s,
+            "k_d": k_d,
+            "k_drag": k_drag,
+            "width": args.width,
+            "height": args.height,
+            "spacing": args.spacing,
+            "ground": args.ground,
+            "pin_corners": args.pin_corners,
+            "integrator": args.integrator,
+            "steps": args.steps,
+            "time_step": args.time_step,
+            "record_every": args.record_every,
+        })
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run particle system scenes headless, in parallel")
+    parser.add_argument("--k_s", type=float, nargs="+", default=[100.0], help="spring stiffness values to sweep")
+    parser.add_argument("--k_d", type=float, nargs="+", default=[2.0], help="spring damping values to sweep")
+    parser.add_argument("--k_drag", type=float, nargs="+", default=[0.1], help="drag coefficients to sweep")
+
+    parser.add_argument("--width", type=int, default=5)
+    parser.add_argument("--height", type=int, default=5)
+    parser.add_argument("--spacing", type=float, default=25.0)
+    parser.add_argument("--ground", type=float, default=-100.0, help="height of the ground plane")
+    parser.add_argument("--pin_corners", action="store_true", help="attach the two top corners")
+    parser.add_argument("--integrator", type=str, default="RK4",
+                        choices=["Euler", "ImplicitEuler", "Midpoint", "RK4", "DormandPrince", "BackwardEuler"])
+
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--time_step", type=float, default=1/30)
+    parser.add_argument("--record_every", type=int, default=1, help="store every n-th frame")
+
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--out", type=str, default="./trajectories", help="output directory")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    configs = make_configs(args)
+    print(f"Running {len(configs)} scenes on {args.workers} workers")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_scene, config, args.out) for config in configs]
+        for future in as_completed(futures):
+            name, path, seconds = future.result()
+            print(f"{name}: {seconds:.2f}s -> {path}")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: seconds per ParticleSystem.evaluate_derivative on a cloth grid, per kernel backend.
+
+    python benchmark_forces.py [--size 100] [--repeats 50]
+"""
+import argparse
+import time
+
+import numpy as np
+
+import Kernels
+from Forces import Gravity, Spring, SpringNetwork, Drag
+from ParticleSystem import ParticleSystem, Particle
+
+
+def make_cloth(size, spacing=25.0, network=True):
+    ps = ParticleSystem()
+    ps.ground.update({'origin' : np.array([0.0, -100.0], dtype=np.float32)})
+
+    for i in range(size):
+        for j in range(size):
+            ps.add_particle(Particle(np.array([i * spacing, j * spacing])))
+    for i in range(size):
+        for j in range(size):
+            if i < size - 1:
+                ps.edges.append((i * size + j, (i + 1) * size + j))
+            if j < size - 1:
+                ps.edges.append((i * size + j, i * size + j + 1))
+
+    ps.add_force(Gravity())
+    if network:
+        ps.add_force(SpringNetwork(ps.edges, 100, 2, spacing))
+    else:
+        for i, j in ps.edges:
+            ps.add_force(Spring(ps.particles[i], ps.particles[j], 100, 2, spacing))
+    ps.add_force(Drag())
+
+    # Some motion so damping terms are not trivially zero
+    ps.particles.velocity[:] = np.random.default_rng(0).normal(size=(len(ps.particles), 2))
+    return ps
+
+
+def measure(ps, repeats):
+    ps.evaluate_derivative()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        ps.evaluate_derivative()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark force kernels")
+    parser.add_argument("--size", type=int, default=100, help="grid is size x size particles")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    Kernels.warm_up()
+    print(f"Kernel warm-up: {time.perf_counter() - start:.3f}s (backend: {Kernels.BACKEND})")
+
+    backends = ['numpy'] + (['numba'] if Kernels.numba is not None else [])
+    print(f"{'backend':<10}{'springs':<16}{'ms / evaluate_derivative':>26}")
+    for backend in backends:
+        Kernels.set_backend(backend)
+        for network in (False, True):
+            seconds = measure(make_cloth(args.size, network=network), args.repeats)
+            springs = "SpringNetwork" if network else "Spring per edge"
+            print(f"{backend:<10}{springs:<16}{seconds * 1e3:>26.3f}")
+
+
+if __name__ == "__main__":
+    main()
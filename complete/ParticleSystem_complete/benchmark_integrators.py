@@ -0,0 +1,125 @@
+"""
+Micro-benchmark: preallocated Midpoint / RK4 against the allocating array versions they replaced.
+
+No forces, no ground and no particle collisions, and only integrator.solve is timed, so
+evaluate_derivative only clears the force buffer and the numbers reflect the integrator's
+own cost. Memory is the peak size of Python heap allocations (tracemalloc) made during one
+steady-state step; for the preallocated integrators it stays constant in N (view objects
+and NumPy's ufunc scratch buffer).
+
+    python benchmark_integrators.py [--sizes 1000 10000 100000] [--steps 20]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from Integrators import Integrator, Midpoint, RK4
+from ParticleSystem import ParticleSystem, Particle
+
+
+class AllocatingMidpoint(Integrator):
+    """ Midpoint as it was before stage buffers: fresh arrays for every stage. """
+    def solve(self, particle_system, time_step):
+        particles = particle_system.particles
+        init_position = particles.position.copy()
+        init_velocity = particles.velocity.copy()
+
+        particle_system.evaluate_derivative()
+        a = particles.force / particles.mass[:, None]
+        particles.position[:] = particles.position + particles.velocity * time_step / 2
+        particles.velocity[:] = particles.velocity + a * time_step / 2
+
+        particle_system.evaluate_derivative()
+        a = particles.force / particles.mass[:, None]
+        particles.position[:] = init_position + particles.velocity * time_step
+        particles.velocity[:] = init_velocity + a * time_step
+
+
+class AllocatingRK4(Integrator):
+    """ RK4 as it was before stage buffers: every k is a new array. """
+    def solve(self, particle_system, time_step):
+        particles = particle_system.particles
+        init_position = particles.position.copy()
+        init_velocity = particles.velocity.copy()
+
+        particle_system.evaluate_derivative()
+        k1_v = particles.force / particles.mass[:, None]
+        k1_x = particles.velocity.copy()
+
+        particles.position[:] = init_position + k1_x * (time_step / 2)
+        particles.velocity[:] = init_velocity + k1_v * (time_step / 2)
+        particle_system.evaluate_derivative()
+        k2_v = particles.force / particles.mass[:, None]
+        k2_x = particles.velocity.copy()
+
+        particles.position[:] = init_position + k2_x * (time_step / 2)
+        particles.velocity[:] = init_velocity + k2_v * (time_step / 2)
+        particle_system.evaluate_derivative()
+        k3_v = particles.force / particles.mass[:, None]
+        k3_x = particles.velocity.copy()
+
+        particles.position[:] = init_position + k3_x * time_step
+        particles.velocity[:] = init_velocity + k3_v * time_step
+        particle_system.evaluate_derivative()
+        k4_v = particles.force / particles.mass[:, None]
+        k4_x = particles.velocity.copy()
+
+        particles.position[:] = init_position + (time_step / 6) * (k1_x + 2 * k2_x + 2 * k3_x + k4_x)
+        particles.velocity[:] = init_velocity + (time_step / 6) * (k1_v + 2 * k2_v + 2 * k3_v + k4_v)
+
+
+def make_system(num_particles, integrator):
+    ps = ParticleSystem(integrator=integrator)
+    ps.ground = None
+    ps.particle_collision['enabled'] = False
+    ps.playing = True
+
+    rng = np.random.default_rng(0)
+    for x in rng.uniform(-100.0, 100.0, size=(num_particles, 2)):
+        ps.add_particle(Particle(x))
+    ps.particles.velocity[:] = rng.normal(size=(num_particles, 2))
+    return ps
+
+
+def measure(num_particles, integrator, steps, time_step=1/30):
+    ps = make_system(num_particles, integrator)
+    ps.step(time_step)  # warm-up, sizes the stage buffers
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        integrator.solve(ps, time_step)
+    seconds = (time.perf_counter() - start) / steps
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    integrator.solve(ps, time_step)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Midpoint/RK4 integrators")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    integrators = [
+        ("Midpoint (allocating)", AllocatingMidpoint),
+        ("Midpoint", Midpoint),
+        ("RK4 (allocating)", AllocatingRK4),
+        ("RK4", RK4),
+    ]
+
+    print(f"{'integrator':<24}{'particles':>10}{'ms/step':>12}{'peak alloc/step':>18}")
+    for n in args.sizes:
+        for name, cls in integrators:
+            seconds, peak = measure(n, cls(), args.steps)
+            print(f"{name:<24}{n:>10}{seconds * 1e3:>12.3f}{peak:>16d} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -67,8 +67,7 @@ def main():
     # -----------------------------    
     k_s = 100
     k_d = 2
-    for i, j in ps.edges:
-        ps.add_force(Spring(ps.particles[i], ps.particles[j], k_s, k_d, spacing))
+    ps.add_force(SpringNetwork(ps.edges, k_s, k_d, spacing))
     
     
     # -----------------------------
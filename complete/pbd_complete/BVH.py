@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def morton_codes(points, bits=10):
+    """ 3 * bits-bit Morton (Z-order) codes of points, quantized within their bounding box. """
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    scale = (2 ** bits - 1) / np.maximum(hi - lo, 1e-12)
+    q = ((points - lo) * scale).astype(np.int64)
+
+    codes = np.zeros(len(points), dtype=np.int64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((q[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+class BVH:
+    """
+    Bounding volume hierarchy over triangles, stored as an implicit complete binary tree:
+    node k has children 2k + 1 and 2k + 2, and the leaves are the last level, one triangle each.
+
+    build() orders the triangles along a Morton curve once. refit() only recomputes the boxes,
+    bottom-up and one vectorized operation per level, so it is O(N) per call. query() walks the
+    tree for many boxes at once, level by level, so its cost is logarithmic per query.
+    """
+    def __init__(self, triangles):
+        self.triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self.num_leaves = 1 << max(0, int(np.ceil(np.log2(max(len(self.triangles), 1)))))
+        self.depth = int(np.log2(self.num_leaves))
+        self.leaf_triangle = np.full(self.num_leaves, -1, dtype=np.int64)
+        # Node boxes as (hi, -lo): a box [lo, hi] given as (-lo, hi) overlaps a node when their sum is >= 0.
+        # Empty leaves get (-inf, -inf) and never overlap anything.
+        self.bounds = np.full((2 * self.num_leaves - 1, 6), -np.inf)
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def build(self, x):
+        centroids = x[self.triangles].mean(axis=1)
+        self.leaf_triangle[:] = -1
+        self.leaf_triangle[:len(self.triangles)] = np.argsort(morton_codes(centroids), kind='stable')
+        self.leaf_vertices = self.triangles[self.leaf_triangle[:len(self.triangles)]]
+        return self.refit(x)
+
+    def refit(self, x, thickness=0.0):
+        """ Recomputes all boxes from the positions x, grown by `thickness`; the tree order is kept. """
+        leaves = self.num_leaves - 1 + np.arange(len(self.triangles))
+        corners = x[self.leaf_vertices]
+        self.bounds[leaves, :3] = corners.max(axis=1) + thickness
+        self.bounds[leaves, 3:] = thickness - corners.min(axis=1)
+
+        # Level l holds the nodes [2^l - 1, 2^(l+1) - 1), and their children are the next level in order
+        for level in range(self.depth - 1, -1, -1):
+            first, last = (1 << level) - 1, (1 << (level + 1)) - 1
+            children = self.bounds[2 * first + 1:2 * last + 1]
+            np.maximum(children[0::2], children[1::2], out=self.bounds[first:last])
+        return self
+
+    def query(self, lo, hi):
+        """ (query index, triangle index) pairs for every query box [lo, hi] (Q, 3) overlapping a triangle box. """
+        box = np.concatenate([-lo, hi], axis=1)
+        query = np.arange(len(lo))
+        node = np.zeros(len(lo), dtype=np.int64)
+        for level in range(self.depth + 1):
+            # np.take is much faster than fancy indexing for row gathers
+            overlap = np.all(np.take(self.bounds, node, axis=0) + np.take(box, query, axis=0) >= 0, axis=1)
+            query, node = query[overlap], node[overlap]
+            if level < self.depth:
+                query = np.repeat(query, 2)
+                node = np.repeat(2 * node + 1, 2)
+                node[1::2] += 1
+
+        return query, self.leaf_triangle[node - (self.num_leaves - 1)]
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def expand_ranges(lo, hi):
+    """ For ranges [lo[k], hi[k]) returns (k, i) for every i in every range, without a Python loop. """
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, lo[owner] + offset
+
+
+def object_bounds(vertices, objects, margin=0.0):
+    """ Per-object AABBs (lo, hi) from the world buffer, inflated by `margin` (scalar or per object). """
+    x = vertices.curr_pos
+    offsets = np.array([obj.offset for obj in objects], dtype=np.int64)
+    lo = np.minimum.reduceat(x, offsets, axis=0)
+    hi = np.maximum.reduceat(x, offsets, axis=0)
+    margin = np.reshape(margin, (-1, 1))
+    return lo - margin, hi + margin
+
+
+class SweepAndPrune:
+    """
+    Broad phase over AABBs: boxes are sorted by their lower bound on one axis, and each box
+    is only tested against the boxes that start before it ends.
+
+    The sort order of the previous call is reused as the starting permutation. Objects move
+    little between frames, so the keys are nearly sorted and the stable sort (timsort) runs
+    in close to linear time.
+    """
+    def __init__(self, axis=0):
+        self.axis = axis
+        self.order = None
+
+    def update(self, lo, hi):
+        """ Index pairs (i, j), i < j, of the overlapping boxes. """
+        n = len(lo)
+        if self.order is None or len(self.order) != n:
+            self.order = np.arange(n)
+        self.order = self.order[np.argsort(lo[self.order, self.axis], kind='stable')]
+
+        # Sweep: box k overlaps, on the sweep axis, the boxes after it that start before it ends
+        sorted_lo = lo[self.order, self.axis]
+        end = np.searchsorted(sorted_lo, hi[self.order, self.axis], side='right')
+        first, second = expand_ranges(np.arange(1, n + 1), end)
+        i, j = self.order[first], self.order[second]
+
+        # Prune on the other axes
+        overlap = np.all((lo[i] <= hi[j]) & (lo[j] <= hi[i]), axis=1)
+        i, j = i[overlap], j[overlap]
+        return np.minimum(i, j), np.maximum(i, j)
+
+
+def face_planes(x, triangles):
+    """ Unit normals and a point of the planes through triangles (..., 3) of global vertex indices. """
+    a, b, c = x[triangles[..., 0]], x[triangles[..., 1]], x[triangles[..., 2]]
+    normal = np.cross(b - a, c - a)
+    normal /= np.maximum(np.linalg.norm(normal, axis=-1, keepdims=True), 1e-12)
+    return normal, a
+
+
+def point_box_contacts(x, point_ids, point_weights, box_faces, tolerance=1e-6):
+    """
+    Narrow phase: surface points of one body inside a convex box.
+
+    Each point is a weighted sum of up to 4 vertices: point_ids (M, P, 4) with point_weights (P, 4),
+    for one (body, box) pair per row, tested against the box whose outward faces are box_faces (M, F, 3).
+    A point is inside when it is behind every face plane by more than `tolerance` (so points on the
+    surface, e.g. of two aligned boxes, are not pushed sideways); its contact face is the closest one.
+    Returns the ids (K, 4) and weights (K, 4) of the contacting points and their face triangles (K, 3).
+    """
+    points = np.einsum('mpjk,pj->mpk', x[point_ids], point_weights)
+    normal, point = face_planes(x, box_faces)
+    d = np.matmul(points, normal.transpose(0, 2, 1)) - np.einsum('mfk,mfk->mf', point, normal)[:, None, :]
+    inside = np.all(d < -tolerance, axis=2)
+    face = np.argmax(d, axis=2)
+
+    m, p = np.nonzero(inside)
+    return point_ids[m, p], point_weights[p], box_faces[m, face[m, p]]
+
+
+def closest_point_on_triangle(p, a, b, c):
+    """ Barycentric weights (K, 3) of the points of the triangles (a, b, c) closest to the points p, all (K, 3). """
+    ab, ac, ap = b - a, c - a, p - a
+    d00, d01, d11 = np.einsum('ij,ij->i', ab, ab), np.einsum('ij,ij->i', ab, ac), np.einsum('ij,ij->i', ac, ac)
+    d20, d21 = np.einsum('ij,ij->i', ap, ab), np.einsum('ij,ij->i', ap, ac)
+    denom = np.maximum(d00 * d11 - d01 * d01, 1e-18)
+    v = (d11 * d20 - d01 * d21) / denom
+    w = (d00 * d21 - d01 * d20) / denom
+    weights = np.stack([1 - v - w, v, w], axis=1)
+    inside = np.all(weights >= 0, axis=1)
+    
+    # Outside the triangle the closest point is on one of its edges
+    if not np.all(inside):
+        corners = (a, b, c)
+        best = np.full(len(p), np.inf)
+        for k in range(3):
+            start, end = corners[k], corners[(k + 1) % 3]
+            t = np.clip(np.einsum('ij,ij->i', p - start, end - start) /
+                        np.maximum(np.einsum('ij,ij->i', end - start, end - start), 1e-18), 0.0, 1.0)
+            distance = np.linalg.norm(p - (start + t[:, None] * (end - start)), axis=1)
+            closer = ~inside & (distance < best)
+            best = np.where(closer, distance, best)
+            edge_weights = np.zeros((len(p), 3))
+            edge_weights[:, k], edge_weights[:, (k + 1) % 3] = 1 - t, t
+            weights[closer] = edge_weights[closer]
+    return weights
+
+
+def closest_points_on_segments(p0, p1, q0, q1):
+    """ Parameters (s, t) of the closest points p0 + s (p1 - p0) and q0 + t (q1 - q0) of two segments, all (K, 3). """
+    d1, d2, r = p1 - p0, q1 - q0, p0 - q0
+    a, e = np.einsum('ij,ij->i', d1, d1), np.einsum('ij,ij->i', d2, d2)
+    b, c, f = np.einsum('ij,ij->i', d1, d2), np.einsum('ij,ij->i', d1, r), np.einsum('ij,ij->i', d2, r)
+    a, e = np.maximum(a, 1e-18), np.maximum(e, 1e-18)
+    
+    # Closest points of the two lines (any s for parallel segments), then clamped to the segments
+    denom = a * e - b * b
+    s = np.where(denom > 1e-12, np.clip((b * f - c * e) / np.where(denom > 1e-12, denom, 1.0), 0.0, 1.0), 0.0)
+    t = (b * s + f) / e
+    s = np.where(t < 0, np.clip(-c / a, 0.0, 1.0), np.where(t > 1, np.clip((b - c) / a, 0.0, 1.0), s))
+    return s, np.clip(t, 0.0, 1.0)
@@ -1,4 +1,6 @@
+import copy
 import numpy as np
+from Collisions import face_planes
 
 class Constraint:
     def __init__(self, compliance=0.0, lambda_=0.0):
@@ -10,6 +12,9 @@ class Constraint:
         pass
     def reset(self):
         self.lambda_ = 0.0
+    def update_masses(self):
+        # Constraints keeping inverse masses re-read them from the vertex buffer
+        pass
         
 class DistanceConstraint(Constraint):
     def __init__(self, body1, id1, body2, id2, rest_length, compliance=0.0, lambda_=0.0):
@@ -21,6 +26,11 @@ class DistanceConstraint(Constraint):
         self.w2 = self.body2.inv_mass
         self.id2 = id2
         
+        # Global vertex indices into the shared buffer
+        self.vertices = body1.buffer
+        self.index1 = body1.global_index(id1)
+        self.index2 = body2.global_index(id2)
+        
         self.rest_length = rest_length
         self.compliance = compliance
         self.lambda_ = lambda_
@@ -29,7 +39,8 @@ class DistanceConstraint(Constraint):
         # --------------------------------------------------
         # TODO (3) : Distance Constraints
         # --------------------------------------------------
-        x1, x2 = self.body1.curr_pos[self.id1], self.body2.curr_pos[self.id2]
+        x = self.vertices.curr_pos
+        x1, x2 = x[self.index1], x[self.index2]
         normal = x1 - x2
         length = np.linalg.norm(normal)
         if length < 1e-6:
@@ -49,8 +60,12 @@ class DistanceConstraint(Constraint):
         dx1 = self.w1 * dlambda * dC1
         dx2 = self.w2 * dlambda * dC2
         
-        self.body1.curr_pos[self.id1] += dx1
-        self.body2.curr_pos[self.id2] += dx2        
+        x[self.index1] += dx1
+        x[self.index2] += dx2        
+
+    def update_masses(self):
+        self.w1 = float(self.vertices.inv_mass[self.index1])
+        self.w2 = float(self.vertices.inv_mass[self.index2])
 
     
 
@@ -60,6 +75,9 @@ class GroundCollisionConstraint(Constraint):
         self.i = i
         self.w = self.body.inv_mass
         
+        self.vertices = body.buffer
+        self.index = body.global_index(i)
+        
         self.n = np.array([0, 1, 0], dtype=np.float32)
         
         self.compliance = compliance
@@ -68,7 +86,7 @@ class GroundCollisionConstraint(Constraint):
         # --------------------------------------------------
         # TODO (4-1) : Ground Collision Constraints
         # --------------------------------------------------
-        x = self.body.curr_pos[self.i]
+        x = self.vertices.curr_pos[self.index]
         
         C = x[1]
         dC = self.n
@@ -81,21 +99,24 @@ class GroundCollisionConstraint(Constraint):
         
         dx = dlambda * dC
         
-        self.body.curr_pos[self.i] += dx  
+        self.vertices.curr_pos[self.index] += dx  
 
     
     def solve_velocity(self):
         # --------------------------------------------------
         # TODO (4-2) : Friction and Restitution
         # --------------------------------------------------
-        v = self.body.vel[self.i]
-        k_f = self.body.friction
-        k_r = self.body.restitution
+        v = self.vertices.vel[self.index]
+        k_f = self.vertices.friction[self.index]
+        k_r = self.vertices.restitution[self.index]
         
         v_n = np.dot(v, self.n) * self.n
         v_t = v - v_n
         
-        self.body.vel[self.i] = - v_n * k_r + v_t * k_f      
+        self.vertices.vel[self.index] = - v_n * k_r + v_t * k_f      
+
+    def update_masses(self):
+        self.w = float(self.vertices.inv_mass[self.index])
         
     
 class AttachmentConstraint(Constraint):
@@ -104,6 +125,9 @@ class AttachmentConstraint(Constraint):
         self.id = id
         self.w = self.body.inv_mass
         
+        self.vertices = body.buffer
+        self.index = body.global_index(id)
+        
         self.init_anchor = np.array(anchor, dtype=np.float32)
         self.anchor = self.init_anchor.copy()
         
@@ -119,7 +143,7 @@ class AttachmentConstraint(Constraint):
         # - C(x) = ||x - anchor||
         # - dC(x) = (x - anchor) / ||x - anchor||
         # --------------------------------------------------        
-        x = self.body.curr_pos[self.id]
+        x = self.vertices.curr_pos[self.index]
         d = x - self.anchor
         length = np.linalg.norm(d)
         
@@ -133,9 +157,535 @@ class AttachmentConstraint(Constraint):
         dlambda = -C / (self.w + alpha)
         dx = dlambda * dC
         
-        self.body.curr_pos[self.id] += self.w * dx
+        self.vertices.curr_pos[self.index] += self.w * dx
         
     
     def reset(self):
         super().reset()
-        self.anchor = self.init_anchor.copy()
\ No newline at end of file
+        self.anchor = self.init_anchor.copy()
+    
+    def update_masses(self):
+        self.w = float(self.vertices.inv_mass[self.index])
+
+
+def shape_matching_goals(x, rest, mass):
+    """
+    Goal positions of bodies x (B, P, 3) matched rigidly to their rest shapes (B, P, 3), with per-vertex
+    masses (B, P): goal = c + R (r - r_c), where c and r_c are the centers of mass and R is the rotation
+    of the polar decomposition of the covariance A = sum m (x - c)(r - r_c)^T.
+    """
+    total = mass.sum(axis=1)[:, None]
+    p = x - np.einsum('bp,bpk->bk', mass, x)[:, None] / total[..., None]
+    q = rest - np.einsum('bp,bpk->bk', mass, rest)[:, None] / total[..., None]
+    A = np.einsum('bp,bpi,bpj->bij', mass, p, q)
+    
+    # R = U V^T, flipping the smallest singular direction when it would be a reflection
+    U, _, Vt = np.linalg.svd(A)
+    U[:, :, 2] *= np.where(np.linalg.det(U @ Vt) < 0, -1.0, 1.0)[:, None]
+    R = U @ Vt
+    return (x - p) + np.einsum('bij,bpj->bpi', R, q)
+
+
+class ShapeMatchingConstraint(Constraint):
+    """
+    Keeps a body rigid: all its vertices are moved towards the rest shape (body.vertices) rotated
+    and translated onto the current positions, by `stiffness` (1: fully rigid) each iteration.
+    """
+    def __init__(self, body, stiffness=1.0):
+        self.body = body
+        self.stiffness = stiffness
+        self.rest = np.array(body.vertices, dtype=np.float64)
+        
+        self.vertices = body.buffer
+        self.index = body.global_index(np.arange(body.num_vertices))
+    
+    def solve(self, h):
+        # Pinned vertices (w = 0) weigh as very heavy ones and are not moved
+        w = self.vertices.inv_mass[self.index]
+        x = self.vertices.curr_pos[self.index]
+        goal = shape_matching_goals(x[None], self.rest[None], 1 / np.maximum(w, 1e-9)[None])[0]
+        
+        self.vertices.curr_pos[self.index] += self.stiffness * (w > 0)[:, None] * (goal - x)
+
+
+def apply_averaged(y, indices, dy):
+    """ y[indices] += dy, averaging the updates that land on the same vertex (a plain sum would overshoot). """
+    count = np.maximum(np.bincount(indices, weights=np.any(dy != 0, axis=1), minlength=len(y)), 1)
+    for axis in range(y.shape[1]):
+        y[:, axis] += np.bincount(indices, weights=dy[:, axis], minlength=len(y)) / count
+
+
+def gradient_triplets(ids, coefficients, directions):
+    """
+    Sparse Jacobian entries (row, dof, value), dof = 3 * vertex + axis, of m rows whose gradient
+    is coefficients (m, n) times directions (m, 3) on the vertices ids (m, n).
+    """
+    m, n = ids.shape
+    row = np.repeat(np.arange(m), 3 * n)
+    dof = (3 * ids[:, :, None] + np.arange(3)).reshape(-1)
+    value = (coefficients[:, :, None] * directions[:, None, :]).reshape(-1)
+    return row, dof, value
+
+
+def vector_rows(ids, coefficients, C):
+    """ A vector constraint C (k, 3) = sum coefficients * x[ids] as 3 scalar rows per constraint, one per axis. """
+    k = len(ids)
+    row, dof, value = gradient_triplets(np.repeat(ids, 3, axis=0), np.repeat(coefficients, 3, axis=0), np.tile(np.eye(3), (k, 1)))
+    return C.reshape(-1), row, dof, value
+
+
+def vector_keys(constraints):
+    """ Row keys (see ConstraintBatch.jacobian) of the vector_rows of the constraints with these indices. """
+    return (3 * constraints[:, None] + np.arange(3)).reshape(-1)
+
+
+def color_constraints(i1, i2):
+    """
+    Greedy graph coloring: constraints of the same color share no vertex.
+    Returns a list of index arrays, one per color.
+    """
+    vertex_colors = {}
+    colors = np.empty(len(i1), dtype=np.int64)
+    for c, (a, b) in enumerate(zip(i1.tolist(), i2.tolist())):
+        used = vertex_colors.get(a, 0) | vertex_colors.get(b, 0)
+        color = (~used & (used + 1)).bit_length() - 1  # lowest free color
+        colors[c] = color
+        vertex_colors[a] = vertex_colors.get(a, 0) | (1 << color)
+        vertex_colors[b] = vertex_colors.get(b, 0) | (1 << color)
+    return [np.nonzero(colors == color)[0] for color in range(colors.max() + 1)] if len(colors) else []
+
+
+class ConstraintBatch(Constraint):
+    """
+    Many constraints of one type as arrays of global vertex indices into `vertices` (a VertexBuffer).
+    corrections(x, h, c) returns (vertex indices, position updates) of the constraints `c`,
+    all computed from the same positions `x`; this is what the Jacobi solver accumulates.
+    """
+    def __init__(self, vertices):
+        self.vertices = vertices
+    
+    def __len__(self):
+        return 0
+    
+    def reset(self):
+        pass
+    
+    def corrections(self, x, h, c=slice(None)):
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 3))
+    
+    def replicate(self, copies, stride, vertices):
+        """
+        The same constraints on `copies` copies of their vertices in `vertices`, copy k shifted by k * stride.
+        None if the type cannot be replicated.
+        """
+        return None
+    
+    def scale_multipliers(self, scale):
+        """ Keeps the part `scale` (per vertex) of the last corrections() in the multipliers, when only that part was applied. """
+        pass
+    
+    def jacobian(self, x):
+        """
+        The constraints as rows for a direct solve: (C (m,), row, dof, value, compliance (m,), key (m,)),
+        the Jacobian given as sparse triplets (see gradient_triplets) and key a stable id of each row below
+        3 * len(self), so multipliers can follow their rows between iterations. None if the type has no such form.
+        """
+        return None
+    
+    def solve(self, h):
+        x = self.vertices.curr_pos
+        indices, dx = self.corrections(x, h)
+        apply_averaged(x, indices, dx)
+
+
+class DistanceConstraintBatch(ConstraintBatch):
+    """
+    DistanceConstraints solved as vectorized Gauss-Seidel sweeps: the constraints are
+    graph-colored, so each color can be projected at once without write conflicts.
+    """
+    def __init__(self, constraints, vertices):
+        super().__init__(vertices)
+        self.i1 = np.array([c.index1 for c in constraints], dtype=np.int64)
+        self.i2 = np.array([c.index2 for c in constraints], dtype=np.int64)
+        self.w1 = np.array([c.w1 for c in constraints], dtype=np.float64)
+        self.w2 = np.array([c.w2 for c in constraints], dtype=np.float64)
+        self.rest_length = np.array([self.target_length(c) for c in constraints], dtype=np.float64)
+        self.compliance = np.array([c.compliance for c in constraints], dtype=np.float64)
+        self.lambda_ = np.zeros(len(constraints))
+        self.dlambda = np.zeros(len(constraints))
+        
+        self.colors = color_constraints(self.i1, self.i2)
+    
+    def __len__(self):
+        return len(self.lambda_)
+    
+    @staticmethod
+    def target_length(constraint):
+        return constraint.rest_length
+    
+    def reset(self):
+        self.lambda_[:] = 0.0
+    
+    def update_masses(self):
+        np.take(self.vertices.inv_mass, self.i1, out=self.w1)
+        np.take(self.vertices.inv_mass, self.i2, out=self.w2)
+    
+    def replicate(self, copies, stride, vertices):
+        batch = copy.copy(self)
+        batch.vertices = vertices
+        shift = np.repeat(np.arange(copies) * stride, len(self))
+        batch.i1 = np.tile(self.i1, copies) + shift
+        batch.i2 = np.tile(self.i2, copies) + shift
+        for name in ('w1', 'w2', 'rest_length', 'compliance', 'lambda_', 'dlambda'):
+            setattr(batch, name, np.tile(getattr(self, name), copies))
+        
+        # The copies share no vertex, so each color stays a color
+        batch.colors = [(np.arange(copies)[:, None] * len(self) + color).reshape(-1) for color in self.colors]
+        return batch
+    
+    def solve(self, h):
+        x = self.vertices.curr_pos
+        for color in self.colors:
+            indices, dx = self.corrections(x, h, color)
+            x[indices] += dx
+    
+    def scale_multipliers(self, scale):
+        # The constraint moves by the mass-weighted share of its two updates
+        w = self.w1 + self.w2
+        applied = (self.w1 * scale[self.i1] + self.w2 * scale[self.i2]) / np.where(w > 0, w, 1.0)
+        self.lambda_ -= (1.0 - applied) * self.dlambda
+    
+    def active(self, length, C):
+        return (length >= 1e-6) & (np.abs(C) >= 1e-6)
+    
+    def assembled(self, length, C):
+        """ Rows kept in a direct solve; satisfied constraints stay, since they must not be broken. """
+        return length >= 1e-6
+    
+    def jacobian(self, x):
+        d = x[self.i1] - x[self.i2]
+        length = np.sqrt(np.einsum('ij,ij->i', d, d))
+        C = length - self.rest_length
+        
+        # Zero-length constraints (hinges) have no gradient at C = 0: they are solved as x1 - x2 = 0
+        point = self.rest_length == 0
+        scalar = ~point & self.assembled(length, C)
+        ids = np.stack([self.i1, self.i2], axis=1)
+        coefficients = np.tile([1.0, -1.0], (len(ids), 1))
+        
+        C_point, row_point, dof_point, value_point = vector_rows(ids[point], coefficients[point], d[point])
+        row, dof, value = gradient_triplets(ids[scalar], coefficients[scalar], d[scalar] / length[scalar, None])
+        return (np.concatenate([C_point, C[scalar]]),
+                np.concatenate([row_point, row + len(C_point)]), np.concatenate([dof_point, dof]), np.concatenate([value_point, value]),
+                np.concatenate([np.repeat(self.compliance[point], 3), self.compliance[scalar]]),
+                np.concatenate([vector_keys(np.flatnonzero(point)), 3 * np.flatnonzero(scalar)]))
+    
+    def corrections(self, x, h, c=slice(None)):
+        """ Vertex indices and position updates of the constraints `c`, as DistanceConstraint.solve. """
+        a, b = self.i1[c], self.i2[c]
+        normal = x[a] - x[b]
+        length = np.sqrt(np.einsum('ij,ij->i', normal, normal))
+        C = length - self.rest_length[c]
+        
+        # Make Constraint Soft!
+        alpha = self.compliance[c] / h / h
+        w1, w2 = self.w1[c], self.w2[c]
+        denominator = w1 + w2 + alpha
+        active = self.active(length, C) & (denominator > 0)
+        
+        dlambda = np.where(active, -(C + alpha * self.lambda_[c]) / np.where(active, denominator, 1.0), 0.0)
+        self.lambda_[c] += dlambda
+        self.dlambda[c] = dlambda
+        
+        dC1 = normal / np.where(active, length, 1.0)[:, None]
+        return np.concatenate([a, b]), np.concatenate([(w1 * dlambda)[:, None] * dC1, (-w2 * dlambda)[:, None] * dC1])
+
+
+class AttachmentConstraintBatch(ConstraintBatch):
+    """ AttachmentConstraints as arrays. Anchors are read live, so detaching still works. """
+    def __init__(self, constraints, vertices):
+        super().__init__(vertices)
+        self.constraints = list(constraints)
+        self.i = np.array([c.index for c in constraints], dtype=np.int64)
+        self.w = np.array([c.w for c in constraints], dtype=np.float64)
+        self.compliance = np.array([c.compliance for c in constraints], dtype=np.float64)
+    
+    def __len__(self):
+        return len(self.i)
+    
+    def update_masses(self):
+        np.take(self.vertices.inv_mass, self.i, out=self.w)
+    
+    def corrections(self, x, h, c=slice(None)):
+        constraints = self.constraints[c] if isinstance(c, slice) else [self.constraints[k] for k in c]
+        attached = np.array([constraint.anchor is not None for constraint in constraints], dtype=bool)
+        anchor = np.array([constraint.anchor if constraint.anchor is not None else np.zeros(3) for constraint in constraints],
+                          dtype=np.float64).reshape(-1, 3)
+        
+        i, w = self.i[c], self.w[c]
+        d = x[i] - anchor
+        length = np.sqrt(np.einsum('ij,ij->i', d, d))
+        
+        # Make Constraint Soft!
+        alpha = self.compliance[c] / h / h
+        active = attached & (length >= 1e-6) & (w + alpha > 0)
+        dlambda = np.where(active, -length / np.where(active, w + alpha, 1.0), 0.0)
+        dC = d / np.where(active, length, 1.0)[:, None]
+        return i, (w * dlambda)[:, None] * dC
+    
+    def replicate(self, copies, stride, vertices):
+        # The copies share the anchors
+        batch = copy.copy(self)
+        batch.vertices = vertices
+        batch.constraints = self.constraints * copies
+        batch.i = np.tile(self.i, copies) + np.repeat(np.arange(copies) * stride, len(self))
+        batch.w = np.tile(self.w, copies)
+        batch.compliance = np.tile(self.compliance, copies)
+        return batch
+    
+    def jacobian(self, x):
+        # x - anchor = 0, as 3 rows per attached vertex
+        attached = np.array([c.anchor is not None for c in self.constraints], dtype=bool)
+        anchor = np.array([c.anchor for c in self.constraints if c.anchor is not None], dtype=np.float64).reshape(-1, 3)
+        i = self.i[attached]
+        C, row, dof, value = vector_rows(i[:, None], np.ones((len(i), 1)), x[i] - anchor)
+        return C, row, dof, value, np.repeat(self.compliance[attached], 3), vector_keys(np.flatnonzero(attached))
+
+
+class GroundContactSet(ConstraintBatch):
+    """
+    Persistent ground contacts: the vertices below the plane y = 0, kept in preallocated arrays.
+    update() removes the vertices that left the ground and appends the ones that crossed it, so
+    contacts are not rebuilt as Python objects every substep. Same response as GroundCollisionConstraint.
+    """
+    def __init__(self, vertices, capacity=64):
+        super().__init__(vertices)
+        self.i = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+        self.in_contact = np.zeros(0, dtype=bool)
+        self.compliance = 0.0
+    
+    def __len__(self):
+        return self.count
+    
+    @property
+    def indices(self):
+        return self.i[:self.count]
+    
+    def reset(self):
+        self.in_contact[:] = False
+        self.count = 0
+    
+    def replicate(self, copies, stride, vertices):
+        # Contacts are found again by update()
+        return GroundContactSet(vertices, capacity=copies * len(self.i))
+    
+    def update(self, compliance=0.0):
+        self.compliance = compliance
+        below = self.vertices.curr_pos[:, 1] < 0
+        if len(self.in_contact) != len(below):
+            # Vertices were added to the world
+            self.in_contact = np.zeros(len(below), dtype=bool)
+            self.in_contact[self.indices] = True
+        
+        # Remove contacts that left the ground, keeping the order of the others
+        indices = self.indices
+        stay = below[indices]
+        self.in_contact[indices[~stay]] = False
+        kept = indices[stay]
+        self.count = len(kept)
+        self.i[:self.count] = kept
+        
+        # Append the vertices that crossed the plane
+        new = np.nonzero(below & ~self.in_contact)[0]
+        if self.count + len(new) > len(self.i):
+            self.i = np.resize(self.i, max(self.count + len(new), 2 * len(self.i)))
+        self.i[self.count:self.count + len(new)] = new
+        self.count += len(new)
+        self.in_contact[new] = True
+        return self
+    
+    def corrections(self, x, h, c=slice(None)):
+        i = self.indices[c]
+        w = self.vertices.inv_mass[i]
+        C = x[i, 1]
+        
+        # Make Constraint Soft!
+        alpha = self.compliance / h / h
+        active = (C < 0) & (w + alpha > 0)
+        dlambda = np.where(active, -C / np.where(active, w + alpha, 1.0), 0.0)
+        dx = np.zeros((len(i), 3))
+        dx[:, 1] = dlambda
+        return i, dx
+    
+    def jacobian(self, x):
+        active = np.flatnonzero(x[self.indices, 1] < 0)
+        i = self.indices[active]
+        row, dof, value = gradient_triplets(i[:, None], np.ones((len(i), 1)), np.tile([0.0, 1.0, 0.0], (len(i), 1)))
+        return x[i, 1], row, dof, value, np.full(len(i), self.compliance), active
+    
+    def solve(self, h):
+        # Every vertex appears once, so the corrections can be applied without accumulation
+        x = self.vertices.curr_pos
+        i, dx = self.corrections(x, h)
+        x[i, 1] += dx[:, 1]
+    
+    def solve_velocity(self):
+        # Friction scales the tangential velocity, restitution reflects the normal one
+        i = self.indices
+        v = self.vertices.vel[i]
+        v_n = v[:, 1].copy()
+        v *= self.vertices.friction[i][:, None]
+        v[:, 1] = -v_n * self.vertices.restitution[i]
+        self.vertices.vel[i] = v
+
+
+class ShapeMatchingConstraintBatch(ConstraintBatch):
+    """
+    ShapeMatchingConstraints of many bodies matched at once with batched SVDs.
+    Bodies with fewer vertices are padded with massless repeats of their own vertices.
+    """
+    def __init__(self, constraints, vertices):
+        super().__init__(vertices)
+        size = max(len(c.index) for c in constraints)
+        self.index = np.array([np.resize(c.index, size) for c in constraints], dtype=np.int64)
+        self.rest = np.array([np.resize(c.rest, (size, 3)) for c in constraints], dtype=np.float64)
+        self.mask = np.arange(size) < np.array([len(c.index) for c in constraints])[:, None]
+        self.stiffness = np.array([c.stiffness for c in constraints], dtype=np.float64)
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def replicate(self, copies, stride, vertices):
+        batch = copy.copy(self)
+        batch.vertices = vertices
+        batch.index = np.tile(self.index, (copies, 1)) + np.repeat(np.arange(copies) * stride, len(self))[:, None]
+        batch.rest = np.tile(self.rest, (copies, 1, 1))
+        batch.mask = np.tile(self.mask, (copies, 1))
+        batch.stiffness = np.tile(self.stiffness, copies)
+        return batch
+    
+    def corrections(self, x, h, c=slice(None)):
+        index, mask = self.index[c], self.mask[c]
+        w = self.vertices.inv_mass[index]
+        goal = shape_matching_goals(x[index], self.rest[c], mask / np.maximum(w, 1e-9))
+        
+        dx = self.stiffness[c, None, None] * (mask & (w > 0))[..., None] * (goal - x[index])
+        return index[mask], dx[mask]
+
+
+class PointTriangleContactBatch(ConstraintBatch):
+    """
+    Surface points pushed out of triangles (a, b, c) along the triangle normal n:
+    C = side * n . (p - q) - thickness >= 0, with q = u a + v b + w c a point of the triangle.
+    Each point is a weighted sum of vertices (ids, weights), and the triangle side the point
+    must stay on is `side` (+1: the normal side). Without barycentric weights the triangle is a
+    face of a box, treated as translating rigidly, so each of its vertices takes a third of the gradient.
+    Friction and restitution act on the velocity of the point relative to the triangle.
+    """
+    def __init__(self, ids, weights, triangle, vertices, compliance=0.0, barycentric=None, side=None, thickness=0.0):
+        super().__init__(vertices)
+        self.ids = np.asarray(ids, dtype=np.int64).reshape(-1, 4)
+        self.weights = np.asarray(weights, dtype=np.float64).reshape(-1, 4)
+        self.face = np.asarray(triangle, dtype=np.int64).reshape(-1, 3)
+        if barycentric is None:
+            barycentric = np.full(self.face.shape, 1 / 3)
+        self.barycentric = np.asarray(barycentric, dtype=np.float64).reshape(-1, 3)
+        self.side = np.ones(len(self.ids)) if side is None else np.asarray(side, dtype=np.float64)
+        self.thickness = thickness
+        self.compliance = compliance
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def point(self, y, c=slice(None)):
+        return np.einsum('ijk,ij->ik', y[self.ids[c]], self.weights[c])
+    
+    def surface_point(self, y, c=slice(None)):
+        return np.einsum('ijk,ij->ik', y[self.face[c]], self.barycentric[c])
+    
+    def normal(self, x, c=slice(None)):
+        """ Unit directions (K, 3) the points are pushed along. """
+        n, _ = face_planes(x, self.face[c])
+        return self.side[c, None] * n
+    
+    def inv_masses(self, c=slice(None)):
+        """ Per-vertex gradient scales of the point and of the triangle, and the effective inverse mass. """
+        w = self.vertices.inv_mass
+        w_point = w[self.ids[c]] * self.weights[c]
+        w_face = w[self.face[c]] * self.barycentric[c]
+        return w_point, w_face, (w_point * self.weights[c]).sum(axis=1) + (w_face * self.barycentric[c]).sum(axis=1)
+    
+    def distribute(self, value, c=slice(None)):
+        """ Per-vertex updates for a vector `value` (K, 3) along the gradient of every contact. """
+        w_point, w_face, _ = self.inv_masses(c)
+        indices = np.concatenate([self.ids[c].reshape(-1), self.face[c].reshape(-1)])
+        dx = np.concatenate([(w_point[:, :, None] * value[:, None, :]).reshape(-1, 3),
+                             (-w_face[:, :, None] * value[:, None, :]).reshape(-1, 3)])
+        return indices, dx
+    
+    def corrections(self, x, h, c=slice(None)):
+        n = self.normal(x, c)
+        C = np.einsum('ij,ij->i', self.point(x, c) - self.surface_point(x, c), n) - self.thickness
+        
+        # Make Constraint Soft!
+        alpha = self.compliance / h / h
+        _, _, w = self.inv_masses(c)
+        active = (C < 0) & (w + alpha > 0)
+        dlambda = np.where(active, -C / np.where(active, w + alpha, 1.0), 0.0)
+        return self.distribute(dlambda[:, None] * n, c)
+    
+    def jacobian(self, x):
+        n = self.normal(x)
+        C = np.einsum('ij,ij->i', self.point(x) - self.surface_point(x), n) - self.thickness
+        active = C < 0
+        ids = np.concatenate([self.ids, self.face], axis=1)[active]
+        coefficients = np.concatenate([self.weights, -self.barycentric], axis=1)[active]
+        row, dof, value = gradient_triplets(ids, coefficients, n[active])
+        return C[active], row, dof, value, np.full(active.sum(), self.compliance), np.flatnonzero(active)
+    
+    def solve_velocity(self):
+        x, v = self.vertices.curr_pos, self.vertices.vel
+        n = self.normal(x)
+        
+        # Velocity of the point relative to the triangle, split into normal and tangential parts
+        v_rel = self.point(v) - self.surface_point(v)
+        v_n = np.einsum('ij,ij->i', v_rel, n)[:, None] * n
+        v_t = v_rel - v_n
+        
+        # Coefficients averaged between the point's first vertex and the triangle
+        p, f = self.ids[:, 0], self.face[:, 0]
+        k_f = (self.vertices.friction[p] + self.vertices.friction[f]) / 2
+        k_r = (self.vertices.restitution[p] + self.vertices.restitution[f]) / 2
+        dv = (-v_n * k_r[:, None] + v_t * k_f[:, None]) - v_rel
+        
+        # Impulse shared like the position correction
+        _, _, w = self.inv_masses()
+        indices, dv = self.distribute(dv / np.where(w > 0, w, 1.0)[:, None])
+        apply_averaged(v, indices, dv)
+
+
+class EdgeEdgeContactBatch(PointTriangleContactBatch):
+    """
+    Closest points of two edges kept `thickness` apart, along their separating direction
+    at detection time. The second edge is stored as a degenerate triangle (c = a).
+    """
+    def __init__(self, edge1, s, edge2, t, direction, vertices, compliance=0.0, thickness=0.0):
+        edge1, edge2 = np.asarray(edge1, dtype=np.int64).reshape(-1, 2), np.asarray(edge2, dtype=np.int64).reshape(-1, 2)
+        s, t = np.asarray(s, dtype=np.float64), np.asarray(t, dtype=np.float64)
+        zeros = np.zeros_like(s)
+        super().__init__(ids=np.column_stack([edge1, edge1]), weights=np.column_stack([1 - s, s, zeros, zeros]),
+                         triangle=np.column_stack([edge2, edge2[:, 0]]), barycentric=np.column_stack([1 - t, t, zeros]),
+                         vertices=vertices, compliance=compliance, thickness=thickness)
+        self.direction = np.asarray(direction, dtype=np.float64).reshape(-1, 3)
+    
+    def normal(self, x, c=slice(None)):
+        return self.direction[c]
+
+
+# Constraint types that PBDSimulation packs into batches
+BATCHES = {
+    DistanceConstraint: DistanceConstraintBatch,
+    AttachmentConstraint: AttachmentConstraintBatch,
+    ShapeMatchingConstraint: ShapeMatchingConstraintBatch,
+}
@@ -57,31 +57,186 @@ def generate_cube(width, height, depth):
     return vertices, faces, edges, normals
 
 
-class Cube:
-    def __init__(self, width=1.0, height=1.0, depth=1.0, positions=[0, 0, 0], rotation=[0, 0, 0], color=(0, 1, 0), wireframe=False):
+def generate_cloth(width, depth, rows, cols):
+    """ Generates a rows x cols grid of quads in the XZ plane, facing +Y, with structural and shear edges. """
+    x, z = np.meshgrid(np.linspace(-width / 2, width / 2, cols + 1), np.linspace(-depth / 2, depth / 2, rows + 1))
+    vertices = np.stack([x, np.zeros_like(x), z], axis=-1).reshape(-1, 3).astype(np.float32)
+    
+    # Corners of every cell: a (i, j), b (i, j + 1), c (i + 1, j), d (i + 1, j + 1)
+    index = np.arange((rows + 1) * (cols + 1)).reshape(rows + 1, cols + 1)
+    a, b = index[:-1, :-1].reshape(-1), index[:-1, 1:].reshape(-1)
+    c, d = index[1:, :-1].reshape(-1), index[1:, 1:].reshape(-1)
+    faces = np.concatenate([np.stack([a, c, d], axis=1), np.stack([a, d, b], axis=1)]).astype(np.uint32)
+    normals = np.tile(np.array([0, 1, 0], dtype=np.float32), (len(faces), 1))
+    
+    edges = np.concatenate([
+        np.stack([index[:, :-1].reshape(-1), index[:, 1:].reshape(-1)], axis=1),  # Along X
+        np.stack([index[:-1, :].reshape(-1), index[1:, :].reshape(-1)], axis=1),  # Along Z
+        np.stack([a, d], axis=1), np.stack([b, c], axis=1),                        # Shear
+    ]).astype(np.uint32)
+    
+    return vertices, faces, edges, normals
+
+
+# Per-vertex state shared by every body of a World: name -> (shape of one vertex, dtype)
+VERTEX_FIELDS = {
+    'init_pos': ((3,), np.float64),
+    'curr_pos': ((3,), np.float64),
+    'prev_pos': ((3,), np.float64),
+    'vel': ((3,), np.float64),
+    'inv_mass': ((), np.float64),
+    'restitution': ((), np.float64),
+    'friction': ((), np.float64),
+}
+
+
+class VertexBuffer:
+    """
+    Contiguous per-vertex arrays (see VERTEX_FIELDS) for many bodies, grown by doubling.
+    buffer.curr_pos etc. are (N, ...) views over the vertices in use. Every body holds views
+    of its own rows; they are rebound whenever the arrays are reallocated.
+    """
+    def __init__(self):
+        self.size = 0
+        self.bodies = []
+        self.data = {name: np.zeros((0,) + shape, dtype=dtype) for name, (shape, dtype) in VERTEX_FIELDS.items()}
+    
+    def __len__(self):
+        return self.size
+    
+    def __getattr__(self, name):
+        data = self.__dict__.get('data', {})
+        if name in data:
+            return data[name][:self.size]
+        raise AttributeError(name)
+    
+    def __setattr__(self, name, value):
+        # Fields are never rebound: an augmented assignment (buffer.vel += dv) would otherwise keep
+        # a view of the current rows in __dict__, hiding __getattr__ after the next add()
+        if name in VERTEX_FIELDS:
+            self.data[name][:self.size] = value
+        else:
+            super().__setattr__(name, value)
+    
+    @property
+    def capacity(self):
+        return len(self.data['curr_pos'])
+    
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name, array in self.data.items():
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.data[name] = grown
+        
+        for body in self.bodies:
+            body.bind(self, body.offset)
+    
+    def add(self, body, num_vertices):
+        """ Appends rows for the body, copying the state it already has, and binds the body to them. """
+        offset = self.size
+        self.reserve(offset + num_vertices)
+        self.size += num_vertices
+        
+        if body.buffer is not None:
+            for name, array in self.data.items():
+                array[offset:offset + num_vertices] = body.views[name]
+        
+        self.bodies.append(body)
+        body.bind(self, offset)
+        return offset
+    
+    def tile(self, copies):
+        """ A new buffer with `copies` copies of these vertices back to back; copy k starts at row k * len(self). """
+        tiled = VertexBuffer()
+        tiled.reserve(copies * self.size)
+        tiled.size = copies * self.size
+        for name, array in self.data.items():
+            tiled.data[name][:tiled.size] = np.concatenate([array[:self.size]] * copies)
+        return tiled
+
+
+def vertex_field(name):
+    """ Per-vertex array of the body; assignment writes into the buffer. """
+    def getter(self):
+        return self.views[name]
+    def setter(self, value):
+        self.views[name][...] = value
+    return property(getter, setter)
+
+
+def body_field(name):
+    """ A value shared by all vertices of the body, stored per vertex in the buffer. """
+    def getter(self):
+        return float(self.views[name][0])
+    def setter(self, value):
+        self.views[name][...] = value
+    return property(getter, setter)
+
+
+class Body:
+    """
+    Simulated vertices. A new body owns a VertexBuffer of its own; World.add_object moves
+    it into the world's shared buffer, and `offset` is then the global index of vertex 0.
+    """
+    init_pos = vertex_field('init_pos')
+    curr_pos = vertex_field('curr_pos')
+    prev_pos = vertex_field('prev_pos')
+    vel = vertex_field('vel')
+    
+    inv_mass = body_field('inv_mass')
+    restitution = body_field('restitution')
+    friction = body_field('friction')
+    
+    # Shape used by the dynamic collision detection (None: the body does not collide with others)
+    collision_shape = None
+    
+    def __init__(self, init_pos):
+        self.buffer = None
+        self.offset = 0
+        self.views = {}
+        self.num_vertices = len(init_pos)
+        VertexBuffer().add(self, self.num_vertices)
+        
+        self.init_pos = init_pos
+        self.curr_pos = self.init_pos
+        self.prev_pos = self.curr_pos
+        self.vel = 0.0
+    
+    def bind(self, buffer, offset):
+        self.buffer = buffer
+        self.offset = offset
+        self.views = {name: array[offset:offset + self.num_vertices] for name, array in buffer.data.items()}
+    
+    def global_index(self, id):
+        return self.offset + id
+
+
+class Mesh(Body):
+    """ A triangle mesh (faces, edges in local vertex ids) placed at `positions` with `rotation`. """
+    collision_shape = 'mesh'
+    
+    def __init__(self, vertices, faces, edges, normals=None, positions=[0, 0, 0], rotation=[0, 0, 0], color=(0, 1, 0), wireframe=False):
         # Mesh 
         self.color = color
-        self.vertices, self.faces, self.edges, self.normals = generate_cube(width, height, depth)
+        self.vertices, self.faces, self.edges, self.normals = vertices, faces, edges, normals
         self.wireframe = wireframe  
         
         self.init_rot = R.from_euler('XYZ', rotation, degrees=True)
-        self.init_pos = np.array(positions, dtype=np.float32) + self.init_rot.apply(self.vertices)
-        
         
         # Physics
-        self.curr_pos = self.init_pos.copy()
-        self.prev_pos = self.curr_pos.copy()
-        self.vel = np.zeros_like(self.curr_pos)
+        super().__init__(np.array(positions, dtype=np.float32) + self.init_rot.apply(self.vertices))
         
         self.inv_mass = 1.0
         self.restitution = 0.1
         self.friction = 0.1
-        
     
     def reset(self):
-        self.curr_pos = self.init_pos.copy()
-        self.prev_pos = self.curr_pos.copy()
-        self.vel = np.zeros_like(self.curr_pos)
+        self.curr_pos = self.init_pos
+        self.prev_pos = self.curr_pos
+        self.vel = 0.0
         
     def draw(self):
         glColor4f(*self.color)
@@ -161,6 +316,28 @@ class Cube:
         glPopAttrib()
     
 
+class Cube(Mesh):
+    collision_shape = 'box'
+    
+    def __init__(self, width=1.0, height=1.0, depth=1.0, positions=[0, 0, 0], rotation=[0, 0, 0], color=(0, 1, 0), wireframe=False):
+        super().__init__(*generate_cube(width, height, depth), positions=positions, rotation=rotation, color=color, wireframe=wireframe)
+    
+    @property
+    def box_faces(self):
+        """ One outward-facing triangle per side of the box (local vertex ids). """
+        return self.faces[::2]
+    
+    @property
+    def contact_points(self):
+        """ Surface points tested for collisions, as (vertex ids, weights): corners, edge midpoints, face centers. """
+        ids = np.zeros((26, 4), dtype=np.int64)
+        weights = np.zeros((26, 4))
+        ids[:8, 0], weights[:8, 0] = np.arange(8), 1.0
+        ids[8:20, :2], weights[8:20, :2] = self.edges[:12], 0.5  # the first 12 edges are the box edges
+        ids[20:], weights[20:] = [np.unique(quad) for quad in self.faces.reshape(6, 6)], 0.25
+        return ids, weights
+    
+
 class Plane:
     def __init__(self, size=10, color=(0.3, 0.3, 0.3, 1.0)):
         self.normal = np.array([0, 1, 0], dtype=np.float32)
@@ -1,12 +1,20 @@
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from concurrent.futures import ThreadPoolExecutor
 from Constraints import *
+from Collisions import *
+from BVH import BVH
 
 class PBDSimulation:
     def __init__(self, 
                  world, 
                  gravity=(0, -9.8, 0), 
                  time_step=0.0333,
-                 substeps=2):
+                 substeps=2,
+                 solver='gauss_seidel',
+                 relaxation=1.0,
+                 num_threads=1):
 
         self.world = world
         self.constraints = []
@@ -16,30 +24,148 @@ class PBDSimulation:
         self.time_step = time_step
         self.substeps = substeps
         self.h = self.time_step / self.substeps
+        
+        # Position solver
+        # - 'gauss_seidel' : constraints solved one by one, in order
+        # - 'colored'      : constraints packed into batches, distances graph-colored (vectorized sweeps)
+        # - 'jacobi'       : every correction computed from the same positions, averaged per vertex
+        #                    and scaled by `relaxation`; large batches are split over `num_threads`
+        # - 'direct'       : all constraints with a Jacobian solved together with a sparse factorization,
+        #                    `direct_iterations` linearized steps; the others are solved before, in order
+        self.solver = solver
+        self.relaxation = relaxation
+        self.num_threads = num_threads
+        self.direct_iterations = 1
+        self.regularization = 1e-9
+        self.batched = None
+        self.executor = None
+        self.state_slots = None
+        self.deterministic = False
 
         # Constraints parameters
         self.collision_compliance = 0.00000001
         self.attach_constraints = []
+        self.ground_contacts = GroundContactSet(world.vertices)
+        
+        # Dynamic collisions between box-shaped objects
+        self.broad_phase = SweepAndPrune()
+        self.collision_margin = 0.05
+        self.jointed = None
+        
+        # Proximity contacts of triangle meshes (only when the world has 'mesh' bodies): vertex-triangle
+        # and, optionally, edge-edge pairs closer than `contact_thickness`, found with a BVH refit every substep
+        self.contact_thickness = 0.02
+        self.edge_contacts = True
+        self.self_collisions = False
+        self.mesh_colliders = None
 
     def add_constraint(self, constraint):
         if isinstance(constraint, Constraint):
             self.constraints.append(constraint)
+            self.batched = None
+            self.jointed = None
+            self.state_slots = None
         
         if isinstance(constraint, AttachmentConstraint):
             self.attach_constraints.append(constraint)
 
+    def update_masses(self):
+        """ Makes the constraints use the current inverse masses of the vertex buffer (e.g. after changing them). """
+        for constraint in self.constraints:
+            constraint.update_masses()
+        if self.batched is not None:
+            for constraint in self.batched:
+                constraint.update_masses()
+
     def detach_all(self):
         for attach_constraint in self.attach_constraints:
             attach_constraint.anchor = None
     
     def reset(self,):
-        for obj in self.world.get_objects():
-            obj.curr_pos = obj.init_pos.copy()
-            obj.prev_pos = obj.curr_pos.copy()
-            obj.vel = np.zeros_like(obj.curr_pos)
+        vertices = self.world.vertices
+        vertices.curr_pos[:] = vertices.init_pos
+        vertices.prev_pos[:] = vertices.curr_pos
+        vertices.vel[:] = 0.0
 
         for constraint in self.constraints:
             constraint.reset()
+        self.ground_contacts.reset()
+        
+        if self.batched is not None:
+            for constraint in self.batched:
+                constraint.reset()
+    
+    def make_deterministic(self):
+        """
+        Float64 end to end: gravity and anchors, stored as float32 by default, are widened so no
+        step mixes precisions. Steps are then a pure function of the state (see World.checksum).
+        """
+        self.deterministic = True
+        self.gravity = self.gravity.astype(np.float64)
+        for constraint in self.attach_constraints:
+            constraint.init_anchor = constraint.init_anchor.astype(np.float64)
+            if constraint.anchor is not None:
+                constraint.anchor = constraint.anchor.astype(np.float64)
+    
+    def state_layout(self):
+        """ (constraints with a scalar lambda, batches with lambda arrays, attachments, state size), built once. """
+        if self.state_slots is None:
+            scalars = [c for c in self.constraints if not isinstance(c, ConstraintBatch) and hasattr(c, 'lambda_')]
+            arrays = [b for b in self.batch_constraints() if isinstance(b, ConstraintBatch) and hasattr(b, 'lambda_')]
+            size = 9 * len(self.world.vertices) + len(scalars) + sum(len(b.lambda_) for b in arrays) + 3 * len(self.attach_constraints)
+            self.state_slots = (scalars, arrays, self.attach_constraints, size)
+        return self.state_slots
+    
+    def get_state(self, out=None):
+        """
+        Positions, previous positions, velocities, constraint lambdas and attachment anchors (NaN when
+        detached) as one float64 vector, written into `out` when given. Valid while no constraint is added.
+        """
+        scalars, arrays, attachments, size = self.state_layout()
+        state = np.empty(size) if out is None else out
+        vertices = self.world.vertices
+        
+        n = 3 * len(vertices)
+        state[0:n] = vertices.curr_pos.reshape(-1)
+        state[n:2 * n] = vertices.prev_pos.reshape(-1)
+        state[2 * n:3 * n] = vertices.vel.reshape(-1)
+        k = 3 * n
+        for constraint in scalars:
+            state[k] = constraint.lambda_
+            k += 1
+        for batch in arrays:
+            state[k:k + len(batch.lambda_)] = batch.lambda_
+            k += len(batch.lambda_)
+        for constraint in attachments:
+            state[k:k + 3] = np.nan if constraint.anchor is None else constraint.anchor
+            k += 3
+        return state
+    
+    def set_state(self, state):
+        """ Restores a state of get_state in place. """
+        scalars, arrays, attachments, size = self.state_layout()
+        vertices = self.world.vertices
+        
+        n = 3 * len(vertices)
+        vertices.curr_pos.reshape(-1)[:] = state[0:n]
+        vertices.prev_pos.reshape(-1)[:] = state[n:2 * n]
+        vertices.vel.reshape(-1)[:] = state[2 * n:3 * n]
+        k = 3 * n
+        for constraint in scalars:
+            constraint.lambda_ = float(state[k])
+            k += 1
+        for batch in arrays:
+            batch.lambda_[:] = state[k:k + len(batch.lambda_)]
+            k += len(batch.lambda_)
+        for constraint in attachments:
+            anchor = state[k:k + 3]
+            if np.isnan(anchor[0]):
+                constraint.anchor = None
+            elif constraint.anchor is None:
+                constraint.anchor = anchor.astype(constraint.init_anchor.dtype)
+            else:
+                constraint.anchor[:] = anchor
+            k += 3
     
     # ==========================================================
     # ================= FILL IN THE CODE BELOW =================
@@ -71,39 +197,198 @@ class PBDSimulation:
                     
     def check_collisions(self):
         # TODO (ADVANCED) : Broad Phase Collision Detection for large number of objects.
-        return []
+        # Sweep and prune over the object AABBs, grown by the distance the objects can travel this frame.
+        # Returns the candidate pairs, both ways, as (points of one box, their weights, faces of the other box).
+        objects = self.world.get_objects()
+        boxes = np.array([k for k, obj in enumerate(objects) if obj.collision_shape == 'box'], dtype=np.int64)
+        if len(boxes) < 2:
+            return []
+        
+        vertices = self.world.vertices
+        offsets = np.array([obj.offset for obj in objects], dtype=np.int64)
+        speed = np.maximum.reduceat(np.linalg.norm(vertices.vel, axis=1), offsets)
+        lo, hi = object_bounds(vertices, objects, speed * self.time_step + self.collision_margin)
+        
+        i, j = self.broad_phase.update(lo[boxes], hi[boxes])
+        i, j = boxes[i], boxes[j]
+        keep = ~np.isin(i * len(objects) + j, self.jointed_pairs())
+        i, j = i[keep], j[keep]
+        if len(i) == 0:
+            return []
+        
+        # Box-shaped objects share the Cube topology
+        box = objects[boxes[0]]
+        body, other = np.concatenate([i, j]), np.concatenate([j, i])
+        point_ids, point_weights = box.contact_points
+        box_faces = box.box_faces.astype(np.int64)
+        return offsets[body][:, None, None] + point_ids, point_weights, offsets[other][:, None, None] + box_faces
+    
+    def jointed_pairs(self):
+        """ Keys i * num_objects + j (i < j) of the objects connected by constraints; they do not collide. """
+        if self.jointed is None:
+            objects = self.world.get_objects()
+            index = {id(obj): k for k, obj in enumerate(objects)}
+            keys = set()
+            for constraint in self.constraints:
+                body1, body2 = getattr(constraint, 'body1', None), getattr(constraint, 'body2', None)
+                if body1 is not None and body2 is not None and body1 is not body2:
+                    i, j = sorted((index[id(body1)], index[id(body2)]))
+                    keys.add(i * len(objects) + j)
+            self.jointed = np.array(sorted(keys), dtype=np.int64)
+        return self.jointed
     
     def generate_contacts(self, collisions):
         contacts = []
         
         # TODO (ADVANCED) : Dynamic - Dynamic Collisions
-        for collision in collisions:
-            pass
+        # Narrow phase: surface points of one box inside the other one
+        if collisions:
+            ids, weights, triangle = point_box_contacts(self.world.vertices.curr_pos, *collisions)
+            if len(ids):
+                contacts.append(PointTriangleContactBatch(ids, weights, triangle, self.world.vertices, compliance=self.collision_compliance))
+        
+        # Triangle meshes: proximity to the triangles of the other meshes and boxes
+        contacts += self.mesh_contacts()
         
         # --------------------------------------------------
         # TODO (4-1) : Generate Ground Collision Constraints
         # - Find the vertices in contact with the ground
         # - Generate Ground Collision Constraints
         # --------------------------------------------------
-        for obj in self.world.get_objects():
-            contact_vertices = np.where(obj.curr_pos[:, 1] < 0)[0]
-            for id in contact_vertices:
-                contacts.append(GroundCollisionConstraint(obj, id, compliance=self.collision_compliance))
+        # Persistent set, updated in place with the vertices that crossed the plane either way
+        contacts.append(self.ground_contacts.update(self.collision_compliance))
             
         return contacts
     
+    def colliding_meshes(self):
+        """
+        One BVH per 'mesh' or 'box' body over its triangles (global vertex ids), with the surface
+        edges of the meshes; None when there is no mesh. Built again only when the number of
+        vertices changes, otherwise the trees are just refit.
+        """
+        vertices = self.world.vertices
+        if self.mesh_colliders is None or self.mesh_colliders['size'] != len(vertices):
+            objects = [obj for obj in self.world.get_objects() if obj.collision_shape in ('mesh', 'box')]
+            bodies = []
+            if any(obj.collision_shape == 'mesh' for obj in objects):
+                for obj in objects:
+                    faces = obj.global_index(obj.faces.astype(np.int64))
+                    edges = np.unique(np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1), axis=0)
+                    bodies.append({'body': obj, 'bvh': BVH(faces).build(vertices.curr_pos), 'edges': edges,
+                                   'vertices': obj.global_index(np.arange(obj.num_vertices))})
+            self.mesh_colliders = {'size': len(vertices), 'bodies': bodies}
+        return self.mesh_colliders['bodies'] or None
+    
+    def mesh_contacts(self):
+        colliders = self.colliding_meshes()
+        if not colliders:
+            return []
+        
+        x = self.world.vertices.curr_pos
+        r = self.contact_thickness
+        for collider in colliders:
+            collider['bvh'].refit(x, r)
+        
+        # Candidate (vertex, triangle) and (edge, edge) pairs of every mesh against the other bodies,
+        # and of the boxes against the meshes; box-box pairs are handled by the box contacts
+        vertex_pairs, edge_pairs = [], []
+        for a in colliders:
+            if a['body'].collision_shape != 'mesh':
+                continue
+            for b in colliders:
+                if b is a and not self.self_collisions:
+                    continue
+                bvh = b['bvh']
+                q, t = bvh.query(x[a['vertices']], x[a['vertices']])
+                vertex_pairs.append((a['vertices'][q], bvh.triangles[t]))
+                if b['body'].collision_shape == 'box':
+                    q, t = a['bvh'].query(x[b['vertices']], x[b['vertices']])
+                    vertex_pairs.append((b['vertices'][q], a['bvh'].triangles[t]))
+                
+                if self.edge_contacts:
+                    e = a['edges']
+                    q, t = bvh.query(np.minimum(x[e[:, 0]], x[e[:, 1]]), np.maximum(x[e[:, 0]], x[e[:, 1]]))
+                    edges = np.sort(bvh.triangles[t][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+                    edge_pairs.append(np.concatenate([np.repeat(e[q], 3, axis=0), edges], axis=1))
+        
+        # A single mesh without self collisions has nothing to collide with (edge pairs come with vertex pairs)
+        if not vertex_pairs:
+            return []
+        
+        contacts = []
+        
+        # Vertex - triangle, without the triangles around the vertex itself
+        v = np.concatenate([v for v, _ in vertex_pairs])
+        tri = np.concatenate([tri for _, tri in vertex_pairs]).reshape(-1, 3)
+        keep = np.all(tri != v[:, None], axis=1)
+        v, tri = v[keep], tri[keep]
+        barycentric = closest_point_on_triangle(x[v], x[tri[:, 0]], x[tri[:, 1]], x[tri[:, 2]])
+        offset = x[v] - np.einsum('ijk,ij->ik', x[tri], barycentric)
+        keep = np.linalg.norm(offset, axis=1) < r
+        if np.any(keep):
+            # Keep the vertex on the side of the triangle it is on now; out of boxes, always
+            n, _ = face_planes(x, tri[keep])
+            box = np.isin(tri[keep, 0], np.concatenate([c['vertices'] for c in colliders if c['body'].collision_shape == 'box'] + [[]]))
+            side = np.where((np.einsum('ij,ij->i', offset[keep], n) >= 0) | box, 1.0, -1.0)
+            ids = np.repeat(v[keep, None], 4, axis=1)
+            weights = np.zeros((len(ids), 4))
+            weights[:, 0] = 1.0
+            contacts.append(PointTriangleContactBatch(ids, weights, tri[keep], self.world.vertices, compliance=self.collision_compliance,
+                                                      barycentric=barycentric[keep], side=side, thickness=r))
+        
+        # Edge - edge, without the pairs sharing a vertex, and each close pair once
+        if edge_pairs:
+            pairs = np.concatenate(edge_pairs)
+            pairs = pairs[np.all(pairs[:, :2, None] != pairs[:, None, 2:], axis=(1, 2))]
+            p0, p1, q0, q1 = x[pairs[:, 0]], x[pairs[:, 1]], x[pairs[:, 2]], x[pairs[:, 3]]
+            s, t = closest_points_on_segments(p0, p1, q0, q1)
+            distance = np.linalg.norm((p0 + s[:, None] * (p1 - p0)) - (q0 + t[:, None] * (q1 - q0)), axis=1)
+            pairs = pairs[(distance < r) & (distance > 1e-9)]
+            
+            swap = (pairs[:, 0] > pairs[:, 2]) | ((pairs[:, 0] == pairs[:, 2]) & (pairs[:, 1] > pairs[:, 3]))
+            pairs[swap] = pairs[swap][:, [2, 3, 0, 1]]
+            pairs = np.unique(pairs, axis=0)
+            if len(pairs):
+                p0, p1, q0, q1 = x[pairs[:, 0]], x[pairs[:, 1]], x[pairs[:, 2]], x[pairs[:, 3]]
+                s, t = closest_points_on_segments(p0, p1, q0, q1)
+                offset = (p0 + s[:, None] * (p1 - p0)) - (q0 + t[:, None] * (q1 - q0))
+                direction = offset / np.linalg.norm(offset, axis=1, keepdims=True)
+                contacts.append(EdgeEdgeContactBatch(pairs[:, :2], s, pairs[:, 2:], t, direction, self.world.vertices,
+                                                     compliance=self.collision_compliance, thickness=r))
+        return contacts
+    
     def integrate(self):
         # --------------------------------------------------
         # TODO (2) : Integrate
         # - Update previous position, velocity and current position
         # --------------------------------------------------
-        for obj in self.world.get_objects():
-            obj.prev_pos = obj.curr_pos.copy()
-            obj.vel += self.gravity * self.h
-            obj.curr_pos += obj.vel * self.h
+        # In-place updates on local views (see VertexBuffer.__setattr__)
+        vertices = self.world.vertices
+        x, v = vertices.curr_pos, vertices.vel
+        vertices.prev_pos[:] = x
+        v += self.gravity * self.h
+        x += v * self.h
 
+    def batch_constraints(self):
+        """ Constraints packed into one batch per type (see BATCHES), followed by the remaining ones. """
+        if self.batched is None:
+            groups, others = {}, []
+            for constraint in self.constraints:
+                if type(constraint) in BATCHES:
+                    groups.setdefault(type(constraint), []).append(constraint)
+                else:
+                    others.append(constraint)
+            self.batched = [BATCHES[kind](group, self.world.vertices) for kind, group in groups.items()] + others
+        return self.batched
+    
     def solve_positions(self, contacts=None):        
-        for constraint in self.constraints:
+        if self.solver == 'jacobi':
+            return self.solve_positions_jacobi(contacts)
+        if self.solver == 'direct':
+            return self.solve_positions_direct(contacts)
+        
+        constraints = self.batch_constraints() if self.solver == 'colored' else self.constraints
+        for constraint in constraints:
             constraint.solve(self.h)
         
         if contacts is None:
@@ -111,14 +396,125 @@ class PBDSimulation:
         
         for contact in contacts:
             contact.solve(self.h)
+    
+    def split_constraints(self, contacts=None):
+        """ The batched constraints and contacts (ConstraintBatch), and the remaining ones. """
+        constraints = self.batch_constraints() + list(contacts or [])
+        batches = [c for c in constraints if isinstance(c, ConstraintBatch)]
+        others = [c for c in constraints if not isinstance(c, ConstraintBatch)]
+        return batches, others
+    
+    def solve_positions_jacobi(self, contacts=None):
+        batches, others = self.split_constraints(contacts)
+        
+        x = self.world.vertices.curr_pos
+        results = self.map_corrections(batches, x)
+        indices = np.concatenate([i for i, _ in results])
+        dx = np.concatenate([d for _, d in results])
+        
+        # Average the corrections of each vertex over the constraints that move it, then over-/under-relax
+        count = np.maximum(np.bincount(indices, weights=np.any(dx != 0, axis=1), minlength=len(x)), 1)
+        scale = self.relaxation / count
+        for axis in range(x.shape[1]):
+            x[:, axis] += np.bincount(indices, weights=dx[:, axis], minlength=len(x)) * scale
+        
+        # The multipliers keep the same part of their update
+        for batch in batches:
+            batch.scale_multipliers(scale)
+        
+        # Constraints without a batched form keep the sequential update
+        for constraint in others:
+            constraint.solve(self.h)
+    
+    def assemble(self, batches):
+        """
+        (C, J, compliance, keys) of the batches with a Jacobian (see ConstraintBatch.jacobian), and the
+        batches without one. keys identify the rows among all 3 * len(batch) possible rows of the batches.
+        """
+        x = self.world.vertices.curr_pos
+        C, rows, dofs, values, compliance, keys, unassembled = [], [], [], [], [], [], []
+        num_rows, num_keys = 0, 0
+        for batch in batches:
+            system = batch.jacobian(x)
+            if system is None:
+                unassembled.append(batch)
+                continue
+            C.append(system[0])
+            rows.append(system[1] + num_rows)
+            dofs.append(system[2])
+            values.append(system[3])
+            compliance.append(system[4])
+            keys.append(system[5] + num_keys)
+            num_rows += len(system[0])
+            num_keys += 3 * len(batch)
+        
+        if num_rows == 0:
+            return np.zeros(0), sp.csr_array((0, x.size)), np.zeros(0), np.zeros(0, dtype=np.int64), unassembled
+        J = sp.csr_array((np.concatenate(values), (np.concatenate(rows), np.concatenate(dofs))), shape=(num_rows, x.size))
+        return np.concatenate(C), J, np.concatenate(compliance), np.concatenate(keys), unassembled
+    
+    def assemble_constraints(self, contacts=None):
+        """
+        All registered constraints (and `contacts`) as one system at the current positions: the constraint
+        values C (m,), their sparse Jacobian J (m, 3N) with column 3 * vertex + axis, and the compliance
+        diagonal (m,). Zero-length distances and attachments are 3 rows each (one per axis), contacts only
+        count while violated; types without a Jacobian (shape matching) are left out.
+        """
+        batches, _ = self.split_constraints(contacts)
+        C, J, compliance, _, _ = self.assemble(batches)
+        return C, J, compliance
+    
+    def solve_positions_direct(self, contacts=None):
+        batches, others = self.split_constraints(contacts)
+        vertices = self.world.vertices
+        W = sp.diags_array(np.repeat(vertices.inv_mass, 3))
+        
+        # Constraints without a Jacobian keep their own update, first, so the direct solve has the last word
+        C, J, compliance, keys, unassembled = self.assemble(batches)
+        for constraint in unassembled + others:
+            constraint.solve(self.h)
+        
+        # Multipliers accumulated over the iterations, by row key
+        lambda_ = np.zeros(3 * sum(len(batch) for batch in batches))
+        for iteration in range(self.direct_iterations):
+            if iteration > 0 or unassembled or others:
+                C, J, compliance, keys, _ = self.assemble(batches)
+            if len(C) == 0:
+                break
+            
+            # (J W J^T + alpha) dlambda = -(C + alpha lambda), alpha = compliance / h^2, regularized
+            # so that redundant rows and rows of pinned vertices keep the matrix nonsingular
+            alpha = compliance / self.h / self.h
+            A = J @ W @ J.T + sp.diags_array(alpha + self.regularization)
+            dlambda = splu(A.tocsc()).solve(-(C + alpha * lambda_[keys]))
+            lambda_[keys] += dlambda
+            x = vertices.curr_pos
+            x += (W @ (J.T @ dlambda)).reshape(-1, 3)
+    
+    def map_corrections(self, batches, x, min_chunk=1024):
+        """ corrections() of every batch; batches larger than min_chunk are split over the thread pool. """
+        tasks = []
+        for batch in batches:
+            num_chunks = max(1, min(self.num_threads, len(batch) // min_chunk))
+            bounds = np.linspace(0, len(batch), num_chunks + 1).astype(int)
+            tasks += [(batch, slice(start, end)) for start, end in zip(bounds[:-1], bounds[1:])]
+        
+        if self.num_threads <= 1 or len(tasks) <= len(batches):
+            return [batch.corrections(x, self.h, c) for batch, c in tasks]
+        
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        return list(self.executor.map(lambda task: task[0].corrections(x, self.h, task[1]), tasks))
             
     def update_velocities(self):
         # --------------------------------------------------
         # TODO (2) : Update Velocities
         # - Update velocities of objects based on the current and previous positions
         # --------------------------------------------------
-        for obj in self.world.get_objects():
-            obj.vel = (obj.curr_pos - obj.prev_pos) / self.h        
+        vertices = self.world.vertices
+        v = vertices.vel
+        np.subtract(vertices.curr_pos, vertices.prev_pos, out=v)
+        v /= self.h        
         
     def solve_velocities(self, contacts):
         for contact in contacts:
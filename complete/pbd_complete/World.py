@@ -1,8 +1,9 @@
 from Simulation import PBDSimulation  
 from Renderer import Renderer
 from Controls import OrbitCamera  
-from Objects import Cube, Plane
+from Objects import Cube, Plane, VertexBuffer
 from Constraints import *
+import zlib
 
 def initWorld(world):
     # ===========================
@@ -60,7 +61,7 @@ def initWorld(world):
     # =============================
     
     attach_comp = 0.00001
-    rigid_comp = 0.00000001
+    rigid_stiffness = 1.0
     hinge_comp = 0.000000
     world.simulation.collision_compliance = 0.00000001
 
@@ -74,12 +75,11 @@ def initWorld(world):
     # ---------------------------------
     # b. Rigid Constraint
     # TODO (3) : Add Rigid Constraints
+    # - One shape matching constraint per cube, instead of a distance constraint per edge
     # ---------------------------------
     for cube in world.get_objects():
         if cube is not None:
-            for edge in cube.edges:
-                rest_length = np.linalg.norm(cube.vertices[edge[0]] - cube.vertices[edge[1]])
-                world.simulation.add_constraint(DistanceConstraint(cube, edge[0], cube, edge[1], rest_length, rigid_comp))
+            world.simulation.add_constraint(ShapeMatchingConstraint(cube, stiffness=rigid_stiffness))
                 
     
     # ---------------------------------
@@ -103,9 +103,13 @@ class World:
         self.objects = []
         self.ground = None
         
+        # Per-vertex state of all objects; each object holds views of its rows
+        self.vertices = VertexBuffer()
+        
         # Simulation
         self.simulation = None
         self.sim_time = 0.0
+        self.state_buffer = None
         self.playing = False
 
         # Rendering
@@ -116,8 +120,10 @@ class World:
         self.ground = ground    
 
     def add_object(self, obj):
+        # Add objects before creating their constraints: constraints resolve global vertex indices once
         if obj is not None:
             self.objects.append(obj)
+            self.vertices.add(obj, obj.num_vertices)
     
     def get_objects(self):
         return self.objects    
@@ -125,6 +131,24 @@ class World:
     def reset(self):
         self.simulation.reset()
         self.sim_time = 0.0
+
+    def get_state(self, out=None):
+        """ sim_time followed by the simulation state (PBDSimulation.get_state), as one flat buffer. """
+        state = np.empty(1 + self.simulation.state_layout()[-1]) if out is None else out
+        state[0] = self.sim_time
+        self.simulation.get_state(state[1:])
+        return state
+
+    def set_state(self, state):
+        self.sim_time = float(state[0])
+        self.simulation.set_state(state[1:])
+
+    def checksum(self):
+        """ CRC32 of the state buffer (get_state): equal checksums mean bitwise equal states. """
+        size = 1 + self.simulation.state_layout()[-1]
+        if self.state_buffer is None or len(self.state_buffer) != size:
+            self.state_buffer = np.empty(size)
+        return zlib.crc32(self.get_state(self.state_buffer))
     
     def step(self):
         if self.playing:
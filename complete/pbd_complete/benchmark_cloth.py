@@ -0,0 +1,89 @@
+"""
+Benchmark: a sheet of cloth dropped onto a box resting on the ground.
+
+Reports per-frame times of the mesh contact search (BVH refit, vertex-triangle and edge-edge
+queries, once per substep) and of the whole step, for growing cloth resolutions. The last
+columns are the number of contacts in the last substep and the lowest cloth vertex height
+above the box top (it should stay around contact_thickness while the cloth lies on the box).
+
+The same cloth is also dropped alone onto the ground: with no other collider (and no self
+collisions) the mesh contact search finds nothing, and the gap is the lowest vertex height.
+
+    python benchmark_cloth.py [--resolution 10 20 40] [--frames 60]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from World import World
+from Simulation import PBDSimulation
+from Objects import Cube, Mesh, generate_cloth
+from Constraints import *
+
+
+def make_world(resolution, solver='colored', with_box=True):
+    world = World()
+    world.simulation = PBDSimulation(world=world, gravity=(0, -9.8, 0), time_step=1/60, substeps=10, solver=solver)
+    world.playing = True
+
+    box = None
+    if with_box:
+        box = Cube(width=2.0, height=1.0, depth=2.0, positions=[0, 0.5, 0])
+        world.add_object(box)
+    cloth = Mesh(*generate_cloth(4.0, 4.0, resolution, resolution), positions=[0.1, 1.5, -0.1], rotation=[0, 10, 0])
+    cloth.inv_mass = resolution ** 2 / 100
+    world.add_object(cloth)
+
+    for obj in world.get_objects():
+        compliance = 1e-8 if obj is box else 1e-6
+        for edge in obj.edges:
+            rest_length = np.linalg.norm(obj.vertices[edge[0]] - obj.vertices[edge[1]])
+            world.simulation.add_constraint(DistanceConstraint(obj, edge[0], obj, edge[1], rest_length, compliance))
+    return world, box, cloth
+
+
+def measure(resolution, frames, with_box=True):
+    world, box, cloth = make_world(resolution, with_box=with_box)
+    sim = world.simulation
+    search = total = 0.0
+    for _ in range(frames):
+        start = time.perf_counter()
+        collisions = sim.check_collisions()
+        for _ in range(sim.substeps):
+            t = time.perf_counter()
+            contacts = sim.generate_contacts(collisions)
+            search += time.perf_counter() - t
+            sim.integrate()
+            sim.solve_positions(contacts)
+            sim.update_velocities()
+            sim.solve_velocities(contacts)
+        total += time.perf_counter() - start
+
+    num_contacts = sum(len(c) for c in contacts[:-1])
+    x = cloth.curr_pos
+    if box is None:
+        return search / frames, total / frames, num_contacts, np.min(x[:, 1])
+    above = np.all(np.abs(x[:, [0, 2]]) < 0.9, axis=1)
+    gap = np.min(x[above, 1]) - np.max(box.curr_pos[:, 1]) if np.any(above) else np.nan
+    return search / frames, total / frames, num_contacts, gap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BVH mesh contacts with cloth on a box")
+    parser.add_argument("--resolution", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--frames", type=int, default=60)
+    args = parser.parse_args()
+
+    for title, with_box in (("Cloth on a box", True), ("Cloth alone on the ground", False)):
+        print(title)
+        print(f"{'cloth':>8}{'triangles':>11}{'search ms':>12}{'frame ms':>12}{'contacts':>10}{'gap':>10}")
+        for n in args.resolution:
+            search, total, num_contacts, gap = measure(n, args.frames, with_box)
+            triangles = 2 * n * n + (12 if with_box else 0)
+            print(f"{f'{n}x{n}':>8}{triangles:>11}{search * 1e3:>12.3f}{total * 1e3:>12.3f}{num_contacts:>10}{gap:>10.4f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
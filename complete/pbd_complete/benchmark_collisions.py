@@ -0,0 +1,112 @@
+"""
+Benchmark: cubes falling in a column onto the ground and onto each other.
+
+Reports per-frame times of the broad phase (check_collisions), the narrow phase
+(vertex-box contacts, once per substep) and the whole step, for growing numbers of cubes.
+The last column counts the surface points still inside another cube at the end (penetrations).
+A second table drops the cubes one per frame into a running world, so the vertex buffer grows
+while the simulation steps.
+
+    python benchmark_collisions.py [--cubes 100 500 1000 2000] [--frames 60]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from World import World
+from Simulation import PBDSimulation
+from Objects import Cube
+from Constraints import *
+from Collisions import point_box_contacts
+
+
+def make_world(num_cubes, solver='colored'):
+    world = World()
+    world.simulation = PBDSimulation(world=world, gravity=(0, -9.8, 0), time_step=1/60, substeps=10, solver=solver)
+    world.playing = True
+
+    # Layers of side x side cubes, with a little spacing, each slightly rotated
+    side = max(1, int(np.ceil(np.sqrt(num_cubes / 4))))
+    rng = np.random.default_rng(0)
+    for k in range(num_cubes):
+        add_cube(world, k, side, rng)
+    return world
+
+
+def add_cube(world, k, side, rng):
+    """ The k-th cube of the layers, with its rigid edges. """
+    layer, cell = divmod(k, side * side)
+    x, z = 1.5 * (cell % side), 1.5 * (cell // side)
+    cube = Cube(width=1.0, height=1.0, depth=1.0, positions=[x, 1.0 + 1.5 * layer, z],
+                rotation=rng.uniform(-20.0, 20.0, size=3))
+    world.add_object(cube)
+
+    for edge in cube.edges:
+        rest_length = np.linalg.norm(cube.vertices[edge[0]] - cube.vertices[edge[1]])
+        world.simulation.add_constraint(DistanceConstraint(cube, edge[0], cube, edge[1], rest_length, 1e-8))
+
+
+def penetrations(world):
+    collisions = world.simulation.check_collisions()
+    if not collisions:
+        return 0
+    ids, weights, _ = point_box_contacts(world.vertices.curr_pos, *collisions)
+    return len(ids)
+
+
+def measure(num_cubes, frames):
+    world = make_world(num_cubes)
+    sim = world.simulation
+    broad = narrow = total = 0.0
+    for _ in range(frames):
+        start = time.perf_counter()
+        collisions = sim.check_collisions()
+        broad += time.perf_counter() - start
+
+        for _ in range(sim.substeps):
+            t = time.perf_counter()
+            contacts = sim.generate_contacts(collisions)
+            narrow += time.perf_counter() - t
+            sim.integrate()
+            sim.solve_positions(contacts)
+            sim.update_velocities()
+            sim.solve_velocities(contacts)
+        total += time.perf_counter() - start
+    return broad / frames, narrow / frames, total / frames, penetrations(world)
+
+
+def measure_spawning(num_cubes, frames):
+    """ One cube added per frame, then `frames` more frames; seconds per frame, vertices in use and penetrations. """
+    world = make_world(0)
+    side = max(1, int(np.ceil(np.sqrt(num_cubes / 4))))
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for k in range(num_cubes + frames):
+        if k < num_cubes:
+            add_cube(world, k, side, rng)
+        world.step()
+    seconds = (time.perf_counter() - start) / (num_cubes + frames)
+    return seconds, len(world.vertices.curr_pos), penetrations(world)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PBD collision detection on falling cubes")
+    parser.add_argument("--cubes", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--frames", type=int, default=60)
+    args = parser.parse_args()
+
+    print(f"{'cubes':>8}{'broad ms':>12}{'narrow ms':>12}{'frame ms':>12}{'ms/cube':>10}{'inside':>8}")
+    for n in args.cubes:
+        broad, narrow, total, inside = measure(n, args.frames)
+        print(f"{n:>8}{broad * 1e3:>12.3f}{narrow * 1e3:>12.3f}{total * 1e3:>12.3f}{total * 1e3 / n:>10.4f}{inside:>8}")
+
+    print("\nCubes added one per frame while stepping")
+    print(f"{'cubes':>8}{'frame ms':>12}{'vertices':>10}{'inside':>8}")
+    for n in args.cubes:
+        seconds, num_vertices, inside = measure_spawning(n, args.frames)
+        print(f"{n:>8}{seconds * 1e3:>12.3f}{num_vertices:>10}{inside:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: the PBD position solvers on a grid of falling cubes.
+
+Throughput: only solve_positions is timed (no contacts), which is where the per-constraint
+Python cost is. The drift column is the largest vertex distance to the sequential Gauss-Seidel
+solver after the same steps.
+
+Convergence: every cube is randomly deformed, then solve_positions is iterated on the same
+substep. The residual is the largest cube edge violation |length - rest_length|.
+
+Rigid bodies: the same measurements with one shape matching constraint per cube instead of
+one distance constraint per edge (24 per cube).
+
+    python benchmark_solvers.py [--cubes 10 100 1000] [--steps 10] [--iterations 20] [--threads 4]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from World import World
+from Simulation import PBDSimulation
+from Objects import Cube
+from Constraints import *
+
+
+SOLVERS = [
+    ("gauss-seidel", dict(solver='gauss_seidel')),
+    ("colored", dict(solver='colored')),
+    ("jacobi", dict(solver='jacobi')),
+    ("jacobi w=1.5", dict(solver='jacobi', relaxation=1.5)),
+    ("direct", dict(solver='direct')),
+]
+
+
+def make_world(num_cubes, rigid='distance', **options):
+    world = World()
+    world.simulation = PBDSimulation(world=world, gravity=(0, -9.8, 0), time_step=1/60, substeps=10, **options)
+
+    side = int(np.ceil(np.sqrt(num_cubes)))
+    for k in range(num_cubes):
+        x, z = 2.0 * (k % side), 2.0 * (k // side)
+        cube = Cube(width=1.0, height=1.0, depth=1.0, positions=[x, 5.0, z], rotation=[10.0 * k, 20.0, 0])
+        world.add_object(cube)
+        if rigid == 'shape':
+            world.simulation.add_constraint(ShapeMatchingConstraint(cube))
+            continue
+        for edge in cube.edges:
+            rest_length = np.linalg.norm(cube.vertices[edge[0]] - cube.vertices[edge[1]])
+            world.simulation.add_constraint(DistanceConstraint(cube, edge[0], cube, edge[1], rest_length, 1e-8))
+    return world
+
+
+def positions(world):
+    return world.vertices.curr_pos.copy()
+
+
+def residual(world):
+    error = 0.0
+    for cube in world.get_objects():
+        length = np.linalg.norm(cube.curr_pos[cube.edges[:, 0]] - cube.curr_pos[cube.edges[:, 1]], axis=1)
+        rest_length = np.linalg.norm(cube.vertices[cube.edges[:, 0]] - cube.vertices[cube.edges[:, 1]], axis=1)
+        error = max(error, np.max(np.abs(length - rest_length)))
+    return error
+
+
+def measure(num_cubes, steps, rigid='distance', **options):
+    world = make_world(num_cubes, rigid, **options)
+    sim = world.simulation
+    sim.solve_positions()  # warm-up, builds the batch
+    sim.reset()
+
+    seconds = 0.0
+    for _ in range(steps):
+        for _ in range(sim.substeps):
+            sim.integrate()
+            # Perturb the positions a little so the constraints have work to do
+            for obj in world.get_objects():
+                obj.curr_pos[0] += 0.01
+            start = time.perf_counter()
+            sim.solve_positions()
+            seconds += time.perf_counter() - start
+            sim.update_velocities()
+    return seconds / (steps * sim.substeps), positions(world)
+
+
+def convergence(num_cubes, iterations, rigid='distance', **options):
+    world = make_world(num_cubes, rigid, **options)
+    sim = world.simulation
+    rng = np.random.default_rng(0)
+    for obj in world.get_objects():
+        obj.curr_pos += rng.normal(scale=0.05, size=obj.curr_pos.shape)
+
+    residuals = []
+    for _ in range(iterations):
+        sim.solve_positions()
+        residuals.append(residual(world))
+    return residuals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PBD position solvers")
+    parser.add_argument("--cubes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    solvers = SOLVERS + [(f"jacobi x{args.threads} threads", dict(solver='jacobi', num_threads=args.threads))]
+
+    print(f"{'solver':<24}{'cubes':>8}{'constraints':>13}{'ms/substep':>12}{'speed-up':>10}{'drift':>12}")
+    for n in args.cubes:
+        reference, x_reference = measure(n, args.steps, **SOLVERS[0][1])
+        for name, options in solvers:
+            seconds, x = measure(n, args.steps, **options)
+            drift = np.max(np.linalg.norm(x - x_reference, axis=1))
+            print(f"{name:<24}{n:>8}{24 * n:>13}{seconds * 1e3:>12.3f}{reference / seconds:>10.1f}{drift:>12.2e}")
+
+    print()
+    print(f"Residual per iteration ({args.cubes[0]} cubes)")
+    history = [(name, convergence(args.cubes[0], args.iterations, **options)) for name, options in SOLVERS]
+    print(f"{'iteration':>10}" + "".join(f"{name:>16}" for name, _ in history))
+    for k in range(args.iterations):
+        print(f"{k + 1:>10}" + "".join(f"{residuals[k]:>16.3e}" for _, residuals in history))
+
+    print()
+    print(f"Rigid bodies: distance constraints vs shape matching ({args.cubes[-1]} cubes)")
+    print(f"{'solver':<24}{'rigid':>10}{'constraints':>13}{'ms/substep':>12}{'residual':>12}")
+    for name, options in SOLVERS[:3]:
+        for rigid, per_cube in (("distance", 24), ("shape", 1)):
+            seconds, _ = measure(args.cubes[-1], args.steps, rigid, **options)
+            error = convergence(args.cubes[-1], 1, rigid, **options)[-1]
+            print(f"{name:<24}{rigid:>10}{per_cube * args.cubes[-1]:>13}{seconds * 1e3:>12.3f}{error:>12.3e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import numpy as np
+from Simulation import PBDSimulation, hinge_torque_forces
+from Constraints import *
+from World import World
+
+
+class BatchedSimulation(PBDSimulation):
+    """
+    `num_envs` independent copies of a world, stepped together.
+
+    All copies live in one vertex buffer (VertexBuffer.tile), seen as (K, N, 3) arrays through
+    `x` and `v`, and every constraint type is one batch over all copies (ConstraintBatch.replicate),
+    so a step costs about the same number of NumPy calls for any K. Copies never collide with
+    each other. The template world must only use constraint types that can be replicated, and
+    the batched solvers ('colored' by default, 'jacobi' or 'direct') are used.
+    """
+    def __init__(self, world, num_envs, solver='colored'):
+        template = world.simulation
+        if solver == 'gauss_seidel':
+            raise ValueError("BatchedSimulation needs a batched solver ('colored', 'jacobi' or 'direct')")
+        unbatched = [c for c in template.batch_constraints() if not isinstance(c, ConstraintBatch)]
+        if unbatched:
+            raise ValueError(f"{type(unbatched[0]).__name__} has no batched form")
+
+        self.num_envs = num_envs
+        self.num_vertices = len(world.vertices)
+        batched_world = World()
+        batched_world.vertices = world.vertices.tile(num_envs)
+
+        batched = [batch.replicate(num_envs, self.num_vertices, batched_world.vertices) for batch in template.batch_constraints()]
+        if None in batched:
+            kind = type(template.batch_constraints()[batched.index(None)]).__name__
+            raise ValueError(f"{kind} cannot be replicated (see ConstraintBatch.replicate)")
+
+        super().__init__(batched_world, gravity=template.gravity, time_step=template.time_step,
+                         substeps=template.substeps, solver=solver)
+        self.collision_compliance = template.collision_compliance
+        self.collision_margin = template.collision_margin
+        self.batched = batched
+
+        # Box pairs of one copy that may collide (not connected by constraints), as in check_collisions
+        objects = world.get_objects()
+        self.offsets = np.array([obj.offset for obj in objects], dtype=np.int64)
+        boxes = [k for k, obj in enumerate(objects) if obj.collision_shape == 'box']
+        jointed = template.jointed_pairs()
+        self.box_pairs = np.array([(i, j) for i in boxes for j in boxes if i < j and i * len(objects) + j not in jointed],
+                                  dtype=np.int64).reshape(-1, 2)
+        if len(self.box_pairs):
+            box = objects[boxes[0]]
+            self.point_ids, self.point_weights = box.contact_points
+            self.box_faces = box.box_faces.astype(np.int64)
+
+        # Joint table of one copy (vertex indices within a copy)
+        self.joints = template.joints
+
+    @property
+    def x(self):
+        return self.world.vertices.curr_pos.reshape(self.num_envs, self.num_vertices, 3)
+
+    @property
+    def v(self):
+        return self.world.vertices.vel.reshape(self.num_envs, self.num_vertices, 3)
+
+    def reset(self, envs=None):
+        """ Resets every copy, or only the copies `envs` (indices or a mask). """
+        if envs is None:
+            return super().reset()
+
+        vertices = self.world.vertices
+        shape = (self.num_envs, self.num_vertices, 3)
+        init_pos = vertices.init_pos.reshape(shape)
+        vertices.curr_pos.reshape(shape)[envs] = init_pos[envs]
+        vertices.prev_pos.reshape(shape)[envs] = init_pos[envs]
+        vertices.vel.reshape(shape)[envs] = 0.0
+
+        # Replicated per-constraint state is laid out copy by copy
+        for batch in self.batched:
+            if hasattr(batch, 'lambda_'):
+                batch.lambda_.reshape(self.num_envs, -1)[envs] = 0.0
+
+    def check_collisions(self):
+        # The candidate pairs are fixed per copy: only their AABBs are tested
+        if len(self.box_pairs) == 0:
+            return []
+
+        x, v = self.x, self.v
+        lo = np.minimum.reduceat(x, self.offsets, axis=1)
+        hi = np.maximum.reduceat(x, self.offsets, axis=1)
+        speed = np.maximum.reduceat(np.linalg.norm(v, axis=2), self.offsets, axis=1)
+        margin = (speed * self.time_step + self.collision_margin)[..., None]
+        lo, hi = lo - margin, hi + margin
+
+        i, j = self.box_pairs[:, 0], self.box_pairs[:, 1]
+        env, pair = np.nonzero(np.all((lo[:, i] <= hi[:, j]) & (lo[:, j] <= hi[:, i]), axis=2))
+        if len(env) == 0:
+            return []
+
+        start = np.concatenate([env, env]) * self.num_vertices
+        body, other = np.concatenate([i[pair], j[pair]]), np.concatenate([j[pair], i[pair]])
+        return ((start + self.offsets[body])[:, None, None] + self.point_ids, self.point_weights,
+                (start + self.offsets[other])[:, None, None] + self.box_faces)
+
+    def apply_action(self, action):
+        """ PBDSimulation.apply_action for every copy at once: `action` is (K, number of joints). """
+        torque = np.asarray(action, dtype=np.float64).reshape(self.num_envs, -1)
+        ids, force = hinge_torque_forces(self.x, self.joints, torque)
+
+        vertices = self.world.vertices
+        ids = (np.arange(self.num_envs)[:, None] * self.num_vertices + ids.reshape(-1)).reshape(-1)
+        np.add.at(vertices.vel, ids, force.reshape(-1, 3) * vertices.inv_mass[ids, None] * self.h)
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class ObservationLayout:
+    """
+    Observation vector described by a list of terms, compiled once against a world.
+
+    Each term is a dict with
+        field:       'center' (body centers), 'positions' or 'velocities' (all vertices of the bodies)
+        bodies:      object indices in world.get_objects()
+        axes:        coordinates to keep, for 'center' (default all three)
+        relative_to: object index whose center is subtracted, for 'center' and 'positions'
+
+    compile() turns the bodies into vertex ranges of the world buffer and the terms into slices
+    of the observation, so fill() only writes into a preallocated float32 array: one NumPy call
+    per term and run of adjacent bodies, no appends. It works on one world, x (N, 3), or a batch,
+    x (K, N, 3).
+    """
+    def __init__(self, terms):
+        self.terms = terms
+
+    def compile(self, world):
+        objects = world.get_objects()
+        self.ranges = [(obj.offset, obj.offset + obj.num_vertices) for obj in objects]
+        self.centers = sorted({body for term in self.terms for body in term['bodies'] if term['field'] == 'center'} |
+                              {term['relative_to'] for term in self.terms if term.get('relative_to') is not None})
+
+        self.ops = []
+        start = 0
+        for term in self.terms:
+            field, relative_to = term['field'], term.get('relative_to')
+            if field == 'center':
+                axes = list(term.get('axes', [0, 1, 2]))
+                for body in term['bodies']:
+                    self.ops.append((field, self.ranges[body], body, axes, relative_to, slice(start, start + len(axes))))
+                    start += len(axes)
+                continue
+
+            # Bodies next to each other in the buffer are written in one go
+            runs = []
+            for body in term['bodies']:
+                first, last = self.ranges[body]
+                if runs and runs[-1][1] == first:
+                    runs[-1][1] = last
+                else:
+                    runs.append([first, last])
+            for first, last in runs:
+                size = 3 * (last - first)
+                self.ops.append((field, (first, last), None, None, relative_to, slice(start, start + size)))
+                start += size
+        self.size = start
+        return self
+
+    def center(self, x, body):
+        first, last = self.ranges[body]
+        return x[..., first:last, :].mean(axis=-2)
+
+    def fill(self, x, v, out):
+        """ Writes the observation of positions x and velocities v (..., N, 3) into out (..., size). """
+        centers = {body: self.center(x, body) for body in self.centers}
+        for field, (first, last), body, axes, relative_to, part in self.ops:
+            target = out[..., part]
+            if field == 'center':
+                value = centers[body][..., axes]
+                if relative_to is not None:
+                    value = value - centers[relative_to][..., axes]
+                target[...] = value
+                continue
+
+            # Vertex rows written as (..., n, 3) views of the observation
+            target = target.reshape(target.shape[:-1] + (last - first, 3))
+            if field == 'positions' and relative_to is not None:
+                np.subtract(x[..., first:last, :], centers[relative_to][..., None, :], out=target)
+            elif field == 'positions':
+                target[...] = x[..., first:last, :]
+            else:
+                target[...] = v[..., first:last, :]
+        return out
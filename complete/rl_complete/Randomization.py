@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class DomainRandomization:
+    """
+    Physical parameters and initial states sampled per episode from the ranges of
+    env: randomization in config.yaml. Samples are written into the existing vertex buffer and
+    constraint arrays (PBDSimulation.update_masses): the world is never rebuilt.
+
+    Keys (all optional; a missing key keeps the nominal value):
+        bodies:                         object indices of the physical parameters (default all)
+        friction, restitution, inv_mass: [low, high], uniform per body
+        action_scale:                   [low, high], uniform per episode
+        init_offset:                    [low, high], uniform shift of the creature along x and z
+        init_velocity:                  standard deviation of a random initial velocity of the creature
+    The creature is every body linked by a joint (PBDSimulation.add_joint), whatever `bodies` is: it
+    gets one offset and one velocity per episode, so it keeps its shape and its joints stay closed.
+    For the K copies of a BatchedSimulation every copy gets its own sample.
+    """
+    PARAMETERS = ('friction', 'restitution', 'inv_mass')
+
+    def __init__(self, simulation, objects, config, action_scale, num_envs=1):
+        self.simulation = simulation
+        self.config = config
+        self.num_envs = num_envs
+        self.num_vertices = len(simulation.world.vertices) // num_envs
+        bodies = config.get('bodies', range(len(objects)))
+        self.ranges = [(objects[b].offset, objects[b].offset + objects[b].num_vertices) for b in bodies]
+        
+        # Bodies owning the hinge vertices of the joints (vertex indices of one copy)
+        offsets = np.array([obj.offset for obj in objects], dtype=np.int64)
+        creature = np.unique(np.searchsorted(offsets, simulation.joints[:2].reshape(-1), side='right') - 1)
+        if len(creature) == 0:
+            creature = list(bodies)
+        self.creature = [(objects[b].offset, objects[b].offset + objects[b].num_vertices) for b in creature]
+        self.action_scale = np.full(num_envs, float(action_scale))
+
+    def view(self, name):
+        """ A vertex field as (K, N, ...) """
+        array = getattr(self.simulation.world.vertices, name)
+        return array.reshape((self.num_envs, self.num_vertices) + array.shape[1:])
+
+    def sample(self, rng, envs=None):
+        """ Samples the copies `envs` (indices or a mask, default all) right after their reset; returns their action scales. """
+        envs = np.arange(self.num_envs) if envs is None else np.arange(self.num_envs)[envs]
+        n, config = len(envs), self.config
+
+        for name in self.PARAMETERS:
+            if name in config:
+                values = rng.uniform(*config[name], size=(n, len(self.ranges)))
+                array = self.view(name)
+                for b, (first, last) in enumerate(self.ranges):
+                    array[envs, first:last] = values[:, b, None]
+        if 'inv_mass' in config:
+            self.simulation.update_masses()
+
+        if 'action_scale' in config:
+            self.action_scale[envs] = rng.uniform(*config['action_scale'], size=n)
+
+        # Initial state: the creature moves as one piece, only its placement and motion change
+        if 'init_offset' in config:
+            shift = np.zeros((n, 1, 3))
+            shift[:, 0, [0, 2]] = rng.uniform(*config['init_offset'], size=(n, 2))
+            x, prev_pos = self.view('curr_pos'), self.view('prev_pos')
+            for first, last in self.creature:
+                x[envs, first:last] += shift
+                prev_pos[envs, first:last] += shift
+        if 'init_velocity' in config:
+            velocity = rng.normal(0.0, config['init_velocity'], size=(n, 1, 3))
+            v = self.view('vel')
+            for first, last in self.creature:
+                v[envs, first:last] = velocity
+        return self.action_scale[envs]
@@ -1,10 +1,11 @@
 from Simulation import PBDSimulation  
 from Renderer import Renderer
 from Controls import OrbitCamera  
-from Objects import Cube, Plane
+from Objects import Cube, Plane, VertexBuffer
 from Constraints import *
+import zlib
 
-def initWorld(world, train_mode=False):
+def initWorld(world, train_mode=False, render=True):
     # ===========================
     # Simulation, Renderer
     # ===========================
@@ -17,14 +18,16 @@ def initWorld(world, train_mode=False):
         
     )
     
-    world.renderer = Renderer(
-        world=world,
-        camera=OrbitCamera(
-            distance=70.0, 
-            theta=80.0, 
-            phi=70.0, 
+    # Without a renderer no window or OpenGL context is created (training, subprocess workers)
+    if render:
+        world.renderer = Renderer(
+            world=world,
+            camera=OrbitCamera(
+                distance=70.0, 
+                theta=80.0, 
+                phi=70.0, 
+            )
         )
-    )
     
     # =============================
     # Create Objects
@@ -97,6 +100,10 @@ def initWorld(world, train_mode=False):
     world.simulation.add_constraint(DistanceConstraint(cube2, 4, cube3, 7, rest_length=0.0, compliance=hinge_comp))
     world.simulation.add_constraint(DistanceConstraint(cube2, 0, cube3, 3, rest_length=0.0, compliance=hinge_comp))
 
+    # Actuated joints (one action each): parent, child, hinge vertices and opposite vertices of each
+    world.simulation.add_joint(cube1, cube2, parent_joint=[1, 5], child_joint=[2, 6], parent_joint_opp=[0, 4], child_joint_opp=[3, 7])
+    world.simulation.add_joint(cube2, cube3, parent_joint=[0, 4], child_joint=[3, 7], parent_joint_opp=[1, 5], child_joint_opp=[2, 6])
+
 
 
     # -------------------------------
@@ -122,12 +129,19 @@ class World:
         self.objects = []
         self.ground = None
         
+        # Per-vertex state of all objects; each object holds views of its rows
+        self.vertices = VertexBuffer()
+        
         # Simulation
         self.simulation = None
         self.sim_time = 0.0
+        self.state_buffer = None
         self.playing = True
 
-        # Rendering
+        # Reward accumulated by the environment, shown by the renderer
+        self.acc_reward = 0.0
+
+        # Rendering (optional)
         self.renderer = None
         self.running = True
     
@@ -135,8 +149,10 @@ class World:
         self.ground = ground    
 
     def add_object(self, obj):
+        # Add objects before creating their constraints: constraints resolve global vertex indices once
         if obj is not None:
             self.objects.append(obj)
+            self.vertices.add(obj, obj.num_vertices)
     
     def get_objects(self):
         return self.objects    
@@ -144,6 +160,24 @@ class World:
     def reset(self):
         self.simulation.reset()
         self.sim_time = 0.0
+
+    def get_state(self, out=None):
+        """ sim_time followed by the simulation state (PBDSimulation.get_state), as one flat buffer. """
+        state = np.empty(1 + self.simulation.state_layout()[-1]) if out is None else out
+        state[0] = self.sim_time
+        self.simulation.get_state(state[1:])
+        return state
+
+    def set_state(self, state):
+        self.sim_time = float(state[0])
+        self.simulation.set_state(state[1:])
+
+    def checksum(self):
+        """ CRC32 of the state buffer (get_state): equal checksums mean bitwise equal states. """
+        size = 1 + self.simulation.state_layout()[-1]
+        if self.state_buffer is None or len(self.state_buffer) != size:
+            self.state_buffer = np.empty(size)
+        return zlib.crc32(self.get_state(self.state_buffer))
     
     def step(self):
         if self.playing:
@@ -151,7 +185,9 @@ class World:
             self.sim_time += self.simulation.time_step
 
     def render(self, ):
-        self.renderer.render()
+        if self.renderer is not None:
+            self.renderer.render()
 
     def handle_events(self):
-        self.renderer.handle_events()
+        if self.renderer is not None:
+            self.renderer.handle_events()
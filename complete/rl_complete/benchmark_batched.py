@@ -0,0 +1,58 @@
+"""
+Benchmark: throughput of the leg world, one copy per WorldEnv vs K copies in one BatchedSimulation.
+
+Random actions, env-steps per second (one env-step is one step_ of one copy of the world).
+The single-world row steps separate worlds one after the other, as a DummyVecEnv would.
+
+    python benchmark_batched.py [--envs 1 16 64 256] [--steps 100]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from World import initWorld
+from rl_main import World_
+from BatchedSimulation import BatchedSimulation
+
+
+def make_world():
+    world = initWorld(World_(), train_mode=True, render=False)
+    world.simulation.solver = 'colored'
+    return world
+
+
+def measure_single(steps):
+    world = make_world()
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(steps):
+        world.step_(rng.uniform(-500.0, 500.0, size=2))
+    return steps / (time.perf_counter() - start)
+
+
+def measure_batched(num_envs, steps):
+    simulation = BatchedSimulation(make_world(), num_envs)
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.step_(rng.uniform(-500.0, 500.0, size=(num_envs, 2)))
+    return num_envs * steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched leg simulation")
+    parser.add_argument("--envs", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--steps", type=int, default=100)
+    args = parser.parse_args()
+
+    single = measure_single(args.steps)
+    print(f"{'envs':>8}{'env-steps/s':>14}{'speed-up':>10}")
+    print(f"{'single':>8}{single:>14.1f}{1.0:>10.1f}")
+    for k in args.envs:
+        rate = measure_batched(k, args.steps)
+        print(f"{k:>8}{rate:>14.1f}{rate / single:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
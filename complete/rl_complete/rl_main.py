@@ -17,13 +17,25 @@ from collections import OrderedDict
 from stable_baselines3 import PPO
 import os
 from stable_baselines3.common.callbacks import CheckpointCallback
+from stable_baselines3.common.vec_env import VecEnv, SubprocVecEnv
+from stable_baselines3.common.env_util import make_vec_env
 import argparse
 from World import World, initWorld
+from BatchedSimulation import BatchedSimulation
+from Observations import ObservationLayout
+from Randomization import DomainRandomization
 import time
 import yaml
 CONFIG_FILE = "config.yaml"
 USER_TORQUE_MODE = False
 
+# Observation: height of cube1, vertices of cube1/2/3 relative to the center of cube1, their velocities
+OBSERVATION_LAYOUT = [
+    dict(field='center', bodies=[0], axes=[1]),
+    dict(field='positions', bodies=[0, 1, 2], relative_to=0),
+    dict(field='velocities', bodies=[0, 1, 2]),
+]
+
 ## World having step_(action) attribute
 class World_(World):
     def __init__(self,):
@@ -44,9 +56,26 @@ class WorldEnv(gym.Env):
 
         self.action_scale = self.cfg_env.get("action_scale", 500.0)
 
+        # Position solver, the same for every env (BatchedWorldEnv needs a batched one)
+        world.simulation.solver = self.cfg_env.get("solver", "colored")
+
+        # Determinism mode: float64 simulation, and a checksum of the state in every info
+        self.deterministic = self.cfg_env.get("deterministic", False)
+        if self.deterministic:
+            world.simulation.make_deterministic()
+
         self.world = world
+        self.observation_layout = ObservationLayout(OBSERVATION_LAYOUT).compile(world)
+        self.obs = np.zeros(self.observation_layout.size, dtype=np.float32)
+
+        # Domain randomization (env: randomization in config.yaml), sampled in reset
+        cfg_randomization = self.cfg_env.get("randomization", {})
+        self.randomization = None
+        if cfg_randomization.get("enabled", False):
+            self.randomization = DomainRandomization(world.simulation, world.get_objects(), cfg_randomization, self.action_scale)
+
         self.action_space = spaces.Box(low=-500.0, high=500.0, shape=(2,), dtype=np.float32)
-        self.observation_space = spaces.Box(low=-100.0, high=100.0, shape=(145,), dtype=np.float32)
+        self.observation_space = spaces.Box(low=-100.0, high=100.0, shape=(self.observation_layout.size,), dtype=np.float32)
         self.max_epi_steps = 300
         self.cur_epi_step = 0
 
@@ -56,7 +85,11 @@ class WorldEnv(gym.Env):
         self.acc_reward = 0.0
 
     def reset(self, seed=None, options=None):
+        # Seeds self.np_random, the generator for anything random in an episode
+        super(WorldEnv, self).reset(seed=seed)
         self.world.reset()
+        if self.randomization is not None:
+            self.action_scale = self.randomization.sample(self.np_random)[0]
         cube1_center = self.compute_center_pos(0)
         self.prev_cube1_center = cube1_center.copy()
         self.acc_reward = 0.0
@@ -64,6 +97,8 @@ class WorldEnv(gym.Env):
         self.cur_epi_step = 0
         obs = self.get_obs()
         info = {}
+        if self.deterministic:
+            info["checksum"] = self.world.checksum()
         return obs, info
     
     def compute_center_pos(self, obj_idx):
@@ -78,7 +113,6 @@ class WorldEnv(gym.Env):
         cube1_center = self.compute_center_pos(0)
 
         reward = 10.0*(cube1_center[0]-self.prev_cube1_center[0])
-        self.world.renderer.acc_reward += reward
         return reward
     
     def is_terminal_state(self):
@@ -88,12 +122,15 @@ class WorldEnv(gym.Env):
         return cube1_center[1] < 2.5
 
     def step(self, action):
+        if self.deterministic:
+            action = np.asarray(action, dtype=np.float64)
         self.world.step_(self.action_scale*action)
         self.cur_epi_step += 1
 
         obs = self.get_obs()
         reward = self.get_reward()
         self.acc_reward += reward
+        self.world.acc_reward += reward
 
         cube1_center = self.compute_center_pos(0)
         self.prev_cube1_center = cube1_center.copy()
@@ -102,6 +139,8 @@ class WorldEnv(gym.Env):
         truncated = self.cur_epi_step > self.max_epi_steps
         terminated = self.is_terminal_state()
         info = {}
+        if self.deterministic:
+            info["checksum"] = self.world.checksum()
 
         return obs, reward, terminated, truncated, info
 
@@ -109,33 +148,138 @@ class WorldEnv(gym.Env):
         # ---------------------------------
         # TODO : Implement observation function
         # ---------------------------------
-        cube1 = self.world.get_objects()[0]
-        cube1_center = cube1.curr_pos.mean(axis=-2)
-        obs = [cube1_center[0]]
+        # Written in place following OBSERVATION_LAYOUT; the caller gets its own copy
+        vertices = self.world.vertices
+        self.observation_layout.fill(vertices.curr_pos, vertices.vel, self.obs)
+        return self.obs.copy()
+
+
+
+class BatchedWorldEnv(VecEnv):
+    """
+    WorldEnv for K copies of the world, all stepped by one BatchedSimulation call.
+    Same observations, rewards and episode ends as WorldEnv; finished copies are reset
+    automatically, with the usual 'terminal_observation' in their info.
+    """
+    def __init__(self, world, num_envs):
+        with open(CONFIG_FILE, "r") as f:
+            config = yaml.safe_load(f)
+
+        self.cfg_env = config.get("env", {})
+
+        self.action_scale = self.cfg_env.get("action_scale", 500.0)
+
+        self.simulation = BatchedSimulation(world, num_envs, solver=self.cfg_env.get("solver", "colored"))
+        self.observation_layout = ObservationLayout(OBSERVATION_LAYOUT).compile(world)
+        self.obs = np.zeros((num_envs, self.observation_layout.size), dtype=np.float32)
+
+        # Domain randomization, one sample per copy (see WorldEnv)
+        cfg_randomization = self.cfg_env.get("randomization", {})
+        self.np_random = np.random.default_rng()
+        self.action_scales = np.full(num_envs, self.action_scale)
+        self.randomization = None
+        if cfg_randomization.get("enabled", False):
+            self.randomization = DomainRandomization(self.simulation, world.get_objects(), cfg_randomization,
+                                                     self.action_scale, num_envs)
+
+        action_space = spaces.Box(low=-500.0, high=500.0, shape=(2,), dtype=np.float32)
+        observation_space = spaces.Box(low=-100.0, high=100.0, shape=(self.observation_layout.size,), dtype=np.float32)
+        super(BatchedWorldEnv, self).__init__(num_envs, observation_space, action_space)
+
+        self.max_epi_steps = 300
+        self.cur_epi_step = np.zeros(num_envs, dtype=np.int64)
+        self.actions = np.zeros((num_envs, 2))
+
+        # Vertices of the three cubes of the leg within one copy
+        self.cubes = [np.arange(obj.offset, obj.offset + obj.num_vertices) for obj in world.get_objects()[:3]]
+
+        self.prev_cube1_center = self.compute_center_pos(0)
+        self.acc_reward = np.zeros(num_envs)
+
+    def seed(self, seed=None):
+        self.np_random = np.random.default_rng(seed)
+        return [seed for _ in range(self.num_envs)]
+
+    def reset(self):
+        self.simulation.reset()
+        if self.randomization is not None:
+            self.action_scales[:] = self.randomization.sample(self.np_random)
+        self.prev_cube1_center = self.compute_center_pos(0)
+        self.acc_reward[:] = 0.0
+        self.cur_epi_step[:] = 0
+        return self.get_obs()
 
-        cube2 = self.world.get_objects()[1]
-        cube2_center = cube2.curr_pos.mean(axis=-2)
+    def compute_center_pos(self, obj_idx):
+        return self.simulation.x[:, self.cubes[obj_idx]].mean(axis=-2)
 
-        cube3 = self.world.get_objects()[2]
-        cube3_center = cube3.curr_pos.mean(axis=-2)
+    def get_reward(self):
+        cube1_center = self.compute_center_pos(0)
+        return 10.0*(cube1_center[:, 0]-self.prev_cube1_center[:, 0])
 
-        obs = [cube1_center[0]- self.prev_cube1_center[0], cube1_center[1],
-               cube2_center[0]- cube1_center[0], cube2_center[1],
-               cube3_center[0]- cube1_center[0], cube3_center[1]]
-        
-        obs = np.array([])
-        obs = np.append(obs, [cube1_center[1]])
-        obs = np.append(obs, (cube1.curr_pos-cube1_center).flatten())
-        obs = np.append(obs, (cube2.curr_pos-cube1_center).flatten())
-        obs = np.append(obs, (cube3.curr_pos-cube1_center).flatten())
+    def is_terminal_state(self):
+        cube1_center = self.compute_center_pos(0)
+        return cube1_center[:, 1] < 2.5
 
-        obs = np.append(obs, cube1.vel.flatten())
-        obs = np.append(obs, cube2.vel.flatten())
-        obs = np.append(obs, cube3.vel.flatten())
-        
+    def step_async(self, actions):
+        self.actions = np.asarray(actions)
 
-        return np.array(obs, dtype=np.float32)
+    def step_wait(self):
+        self.simulation.step_(self.action_scales[:, None]*self.actions)
+        self.cur_epi_step += 1
 
+        obs = self.get_obs()
+        reward = self.get_reward()
+        self.acc_reward += reward
+        self.prev_cube1_center = self.compute_center_pos(0)
+
+        truncated = self.cur_epi_step > self.max_epi_steps
+        terminated = self.is_terminal_state()
+        dones = terminated | truncated
+        infos = [{} for _ in range(self.num_envs)]
+
+        # Reset the finished copies, keeping their last observation
+        if np.any(dones):
+            for k in np.nonzero(dones)[0]:
+                infos[k]["terminal_observation"] = obs[k].copy()
+                infos[k]["TimeLimit.truncated"] = bool(truncated[k] and not terminated[k])
+            self.simulation.reset(dones)
+            if self.randomization is not None:
+                self.action_scales[dones] = self.randomization.sample(self.np_random, dones)
+            self.prev_cube1_center[dones] = self.compute_center_pos(0)[dones]
+            self.acc_reward[dones] = 0.0
+            self.cur_epi_step[dones] = 0
+            obs[dones] = self.get_obs()[dones]
+
+        return obs, reward.astype(np.float32), dones, infos
+
+    def get_obs(self):
+        self.observation_layout.fill(self.simulation.x, self.simulation.v, self.obs)
+        return self.obs.copy()
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        return [indices] if isinstance(indices, int) else indices
+
+
+def make_env():
+    """ A WorldEnv on its own render-free training world, e.g. for one SubprocVecEnv worker. """
+    return WorldEnv(initWorld(World_(), train_mode=True, render=False))
 
 
 def test(env, model):
@@ -210,9 +354,19 @@ def main():
     cfg_ppo_kwargs = config.get("ppo_kwargs", {})
 
 
-    world = initWorld(World_(), args.train)
+    # Training does not open a window
+    world = initWorld(World_(), args.train, render=not args.train)
     env = WorldEnv(world)
 
+    # Training on K copies of the world stepped together (env: batched_envs in config.yaml),
+    # or on one world per worker process (env: num_envs)
+    batched_envs = config.get("env", {}).get("batched_envs", 1)
+    num_envs = config.get("env", {}).get("num_envs", 1)
+    if args.train and batched_envs > 1:
+        env = BatchedWorldEnv(world, batched_envs)
+    elif args.train and num_envs > 1:
+        env = make_vec_env(make_env, n_envs=num_envs, vec_env_cls=SubprocVecEnv)
+
 
     # The value on the side is the default value when the 'key' does not exit.
     # You should change the config.yml file to make any difference.